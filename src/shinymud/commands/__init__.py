@@ -1,6 +1,9 @@
 from shinymud.lib.world import *
 from shinymud.data.config import *
 from shinymud.lib.registers import CommandRegister
+
+import time
+
 def get_permission_names(perm_int):
     """Takes an integer representing a set of permissions and returns a list
     of corresponding permission names."""
@@ -32,7 +35,11 @@ class BaseCommand(object):
     
     def run(self):
         if self.allowed:
+            start = time.time()
             self.execute()
+            # Keep track of how long our commands take (see "help lag")
+            self.world.profiler.charge('commands', self.__class__.__name__.lower(),
+                                       time.time() - start)
         else:
             self.pc.update_output("You don't have the authority to do that!\n")
     
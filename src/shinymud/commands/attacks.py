@@ -50,11 +50,13 @@ class Attack(BattleAction):
         if not damage:
             damage = {'impact': randint(1,2)}
         total = self.target.takes_damage(damage, self.attacker.fancy_name())
-        self.attacker.update_output("You attack %s for %s damage!" % (self.target.fancy_name(), str(total)))
+        self.attacker.update_output("You attack %s for %s damage!" % (self.target.fancy_name(), str(total)),
+                                    critical=False)
     
     def miss(self):
-        self.attacker.update_output("You attack %s but miss!" % self.target.fancy_name())
-        self.target.update_output("%s tried to attack you, but missed" % (self.attacker.fancy_name()))
+        self.attacker.update_output("You attack %s but miss!" % self.target.fancy_name(), critical=False)
+        self.target.update_output("%s tried to attack you, but missed" % (self.attacker.fancy_name()),
+                                  critical=False)
     
     def critical(self):
         """Critical attacks do up to twice as much damage.
@@ -64,7 +66,8 @@ class Attack(BattleAction):
             base_damage = {'impact': 3}
         damage = dict([(key, randint(int(1.5 * val + 0.5), 2* val)) for key, val in base_damage.items()])
         total = self.target.takes_damage(damage, "Critical Hit! %s" % self.attacker.fancy_name())
-        self.attacker.update_output("Critical Hit! You strike %s for %s damage!" % (self.target.fancy_name(), str(total)))
+        self.attacker.update_output("Critical Hit! You strike %s for %s damage!" % (self.target.fancy_name(), str(total)),
+                                    critical=False)
     
 
 Action_list.register(Attack, ['attack'])
@@ -8,6 +8,7 @@ from shinymud.commands import *
 from shinymud.data.config import EQUIP_SLOTS, DAMAGE_TYPES
 
 import shinymud.lib.sport as Sport
+import itertools
 import re
 
 build_list = CommandRegister()
@@ -516,7 +517,12 @@ or script.
                     self.pc.update_output('You\'re not allowed to destroy someone else\'s area.\n')
                     return
             if func == 'area':
-                message = self.world.destroy_area(area_name, self.pc.name)
+                # Taking apart a big area can take a while; do it a bit at a
+                # time (see "help tasks")
+                self.world.tasks.start('destroy area %s' % area_name,
+                                       self.world.destroy_area_steps(area_name, self.pc.name),
+                                       self.pc)
+                message = 'Destroying area %s. Type "tasks" to check on it.\n' % area_name
             elif area and hasattr(area, 'destroy_' + func):
                 message = getattr(area, 'destroy_' + func)(obj_id)
             else:
@@ -574,7 +580,8 @@ config file. To import an area that has been exported to a text file, see
                 self.pc.update_output('%s "%s" doesn\'t exist.' % (t.capitalize(), name))
             else:
                 self.pc.update_output('Exporting %s %s. This may take a moment.' % (t, obj.name))
-                self.pc.update_output(Sport.export(t, obj, format, trans))
+                self.world.tasks.start('export %s %s' % (t, obj.name),
+                                       Sport.export_steps(t, obj, format, trans), self.pc)
     
     def get_player(self, name):
         """Take a player's name, return a player instance if there's a character
@@ -620,8 +627,9 @@ To export areas to text-files, see "help export".
         elif self.args.startswith('built-in'):
             # Import all of areas in the PREPACK directory
             self.pc.update_output(' Importing Built-In Areas '.center(50, '-'))
-            result = Sport.inport_dir('area', source_path=PREPACK)
-            self.pc.update_output(result + ('-' * 50))
+            steps = itertools.chain(Sport.inport_dir_steps('area', source_path=PREPACK),
+                                    ['-' * 50])
+            self.world.tasks.start('import built-in areas', steps, self.pc)
         else:
             exp = r'(?P<list>list[ ]+)?(?P<type>\w+)([ ]+((?P<name>\w+)))?' +\
                   r'([ ]+(from[ ]+)(?P<trans>\w+))?([ ]+(in[ ]+)(?P<format>\w[\w ]*))?$'
@@ -635,7 +643,8 @@ To export areas to text-files, see "help export".
                 self.pc.update_output(Sport.list_importable(t, format, trans))
             else:
                 # Import an area
-                self.pc.update_output(Sport.inport(t, name, format, trans))
+                self.world.tasks.start('import %s %s' % (t, name),
+                                       Sport.inport_steps(t, name, format, trans), self.pc)
     
 
 build_list.register(Import, ['import'])
@@ -4,8 +4,11 @@ from shinymud.commands.emotes import *
 from shinymud.commands.attacks import *
 from shinymud.commands import *
 from shinymud.lib.battle import Battle
+from shinymud.lib.stats import ms
 
+import itertools
 import re
+import time
    
 # ************************ GENERIC COMMANDS ************************
 command_list = CommandRegister()
@@ -148,6 +151,36 @@ automatically be turned back on.
 command_list.register(Channel, ['channel'])
 command_help.register(Channel.help, ['channel'])
 
+class Prompt(BaseCommand):
+    """Toggles the player's text prompt on and off."""
+    help = (
+"""Prompt (command)
+The prompt command turns the prompt that shows your HP and MP after each
+command on or off. Clients that get your vitals through GMCP (or the websocket
+out-of-band channel) don't need it.
+\nUSAGE:
+To see whether your prompt is on or off:
+  prompt
+To turn your prompt on or off:
+  prompt on
+  prompt off
+"""
+    )
+    def execute(self):
+        toggle = {'on': True, 'off': False}
+        choice = self.args.strip().lower()
+        if not choice:
+            self.pc.update_output('Your prompt is %s.' % (self.pc.show_prompt and 'on' or 'off'))
+        elif choice in toggle:
+            self.pc.show_prompt = toggle[choice]
+            self.pc.update_output('Your prompt has been turned %s.' % choice)
+        else:
+            self.pc.update_output('You can only turn your prompt on or off.')
+    
+
+command_list.register(Prompt, ['prompt'])
+command_help.register(Prompt.help, ['prompt'])
+
 class Build(BaseCommand):
     """Activate or deactivate build mode."""
     required_permissions = BUILDER
@@ -1320,8 +1353,10 @@ see "help spawns".""")
                 # reset an entire area
                 reset_area = self.world.get_area(area)
                 if reset_area:
-                    reset_area.reset()
-                    self.pc.update_output('Area %s has been reset.\n' % reset_area.name)
+                    # A big area can take a while; do it a bit at a time
+                    steps = itertools.chain(reset_area.reset_steps(),
+                                            ['Area %s has been reset.\n' % reset_area.name])
+                    self.world.tasks.start('reset area %s' % reset_area.name, steps, self.pc)
                     return
                 else:
                     self.pc.update_output('That area doesn\'t exist.\n')
@@ -1349,6 +1384,57 @@ see "help spawns".""")
 command_list.register(Reset, ['reset'])
 command_help.register(Reset.help, ['reset', 'resets'])
 
+class Tasks(BaseCommand):
+    """List (or cancel) the long-running jobs the world is working on."""
+    required_permissions = DM | BUILDER | ADMIN
+    help = (
+    """<title>Tasks (Command)</title>
+Some jobs are too big for the world to do all at once without making everyone
+wait, such as destroying, importing or exporting an area, or resetting an
+entire area. These are done a little at a time instead, as "tasks", and you'll
+be told how they went when they're done. The Tasks command shows the tasks
+that are still running, and lets you cancel them.
+\nREQUIRED PERMISSIONS: DM, BUILDER, or ADMIN
+\nUSAGE:
+To list the running tasks:
+  tasks
+To cancel a task:
+  tasks cancel <task-id>
+\nYou can only cancel tasks that you started, unless you're an ADMIN.
+    """
+    )
+    def execute(self):
+        if not self.args:
+            string = ' Tasks '.center(50, '-') + '\n'
+            for task in self.world.tasks.tasks:
+                string += '[%s] %s (started by %s)\n' % (task.id, task.name,
+                                                         getattr(task.owner, 'name', 'the world'))
+                string += '    %s steps, %s running time over %s seconds: %s\n' % \
+                          (task.steps_run, ms(task.runtime),
+                           int(time.time() - task.started), task.status)
+            if not self.world.tasks.tasks:
+                string += 'There aren\'t any tasks running.\n'
+            string += '-' * 50
+            self.pc.update_output(string)
+            return
+        match = re.match(r'cancel[ ]+(?P<id>\d+)$', self.args.strip(), re.I)
+        if not match:
+            self.pc.update_output('Type "help tasks" to get help with this command.')
+            return
+        task = self.world.tasks.get(int(match.group('id')))
+        if not task:
+            self.pc.update_output('There isn\'t a task with that id.')
+        elif task.owner is not self.pc and not (self.pc.permissions & (ADMIN | GOD)):
+            self.pc.update_output('You can only cancel the tasks you started.')
+        else:
+            task.cancel()
+            if task.owner is not self.pc:
+                self.pc.update_output('Task %s (%s) has been cancelled.' % (task.id, task.name))
+    
+
+command_list.register(Tasks, ['tasks', 'task'])
+command_help.register(Tasks.help, ['tasks', 'task'])
+
 class Help(BaseCommand):
     help = ("Try 'help <command-name>' for help with a command.\n"
             "For example, 'help go' will give details about the go command."
@@ -2364,6 +2450,158 @@ You must be in the same room as an npc to log it.
 command_list.register(Log, ['log'])
 command_help.register(Log.help, ['log'])
 
+class Latency(BaseCommand):
+    required_permissions = ADMIN
+    help = (
+    """<title>Latency (Command)</title>
+The Latency command shows how long players have recently been waiting between
+sending a line of input and receiving the output it produced, along with the
+input dispatch mode the game is running in (see INPUT_DISPATCH in the config
+file). It also shows how many rooms are waiting for their area's scheduled
+reset, and how long rooms have had to wait (see RESET_BUDGET).
+\nREQUIRED PERMISSIONS: ADMIN
+\nUSAGE:
+  latency
+    """
+    )
+    def execute(self):
+        latency = self.world.input_latency
+        string = ' Input Latency '.center(50, '-') + '\n'
+        string += 'Dispatch mode: %s\n' % INPUT_DISPATCH
+        string += 'Samples: %s\n' % len(latency)
+        string += 'p50: %s\n' % ms(latency.percentile(50))
+        string += 'p99: %s\n' % ms(latency.percentile(99))
+        string += 'max: %s\n' % ms(latency.max())
+        stats = self.world.reset_stats
+        string += ' Resets '.center(50, '-') + '\n'
+        string += 'Rooms waiting to reset: %s (most ever: %s)\n' % \
+                  (len(self.world.reset_queue), stats['max_pending'])
+        string += 'Rooms reset: %s\n' % stats['rooms_reset']
+        string += 'Longest wait: %s\n' % ms(stats['max_wait'])
+        string += '-' * 50
+        self.pc.update_output(string)
+    
+
+command_list.register(Latency, ['latency'])
+command_help.register(Latency.help, ['latency'])
+
+class Netstat(BaseCommand):
+    required_permissions = ADMIN
+    help = (
+    """<title>Netstat (Command)</title>
+The Netstat command shows how much output the game has queued for players and
+how much it has had to drop because of slow (stalled) connections, along with
+the players whose connections are currently stalled (see OUTPUT_HIGH_WATER and
+OUTPUT_POLICY in the config file), and how well each player's output is being
+compressed by MCCP (see MCCP_ENABLED).
+\nREQUIRED PERMISSIONS: ADMIN
+\nUSAGE:
+  netstat
+    """
+    )
+    def execute(self):
+        stats = self.world.net_stats
+        string = ' Network Stats '.center(50, '-') + '\n'
+        string += 'Output policy: %s (high water %s bytes)\n' % (OUTPUT_POLICY, OUTPUT_HIGH_WATER)
+        string += 'Bytes queued: %s\n' % stats['bytes_queued']
+        string += 'Bytes dropped: %s\n' % stats['bytes_dropped']
+        string += 'Stalls: %s\n' % stats['stalls']
+        string += 'Connections rejected: %s\n' % stats['rejected']
+        stalled = [p for p in self.world.player_list.values() if p.backlog is not None]
+        if stalled:
+            string += 'Currently stalled:\n'
+            now = time.time()
+            for player in stalled:
+                string += '  %s - %s bytes unsent, %s held, for %ds\n' % (player.name,
+                          len(player.conn.outbuf), player.backlog.size, now - player.stalled_since)
+        compressed = [p for p in self.world.player_list.values()
+                      if getattr(p.conn, 'compressed_bytes', 0)]
+        if compressed:
+            string += 'MCCP compression:\n'
+            for player in compressed:
+                string += '  %s - %s bytes sent as %s (%.1f:1)\n' % (player.name,
+                          player.conn.raw_bytes, player.conn.compressed_bytes,
+                          player.conn.compression_ratio())
+        string += '-' * 50
+        self.pc.update_output(string)
+    
+
+command_list.register(Netstat, ['netstat'])
+command_help.register(Netstat.help, ['netstat'])
+
+class Lag(BaseCommand):
+    required_permissions = GOD
+    help = (
+    """<title>Lag (Command)</title>
+The Lag command shows where the world's time has been going. Every turn is
+split into phases (npc ticks, player input and commands, cleanup, effects,
+battles, timers, area resets, tasks and sending output), and Lag shows how
+long each phase has been taking over the last TURN_HISTORY turns (see the
+config file). It also names the commands, areas and battles that have taken
+the longest in a single turn. For each of the world's subsystems, it shows
+the subsystem's tick rate, how late its ticks have been starting (the tick
+lag) and how many ticks it has had to miss (see TICK_RATES and TICK_POLICY).
+Lag also counts the npcs waiting to run their commands each turn, and the npc
+commands that were dropped (see NPC_BUDGET and NPC_CMDQ_LIMIT).
+\nREQUIRED PERMISSIONS: GOD
+\nUSAGE:
+To see the timings for all of the turns we have on record:
+  lag
+To name the slowest commands, areas and battles of just the last few turns:
+  lag <number-of-turns>
+    """
+    )
+    def execute(self):
+        profiler = self.world.profiler
+        turns = None
+        if self.args:
+            if not self.args.strip().isdigit():
+                self.pc.update_output('Type "help lag" to get help with this command.')
+                return
+            turns = int(self.args.strip())
+        string = ' Lag '.center(50, '-') + '\n'
+        string += 'Tick policy: %s\n' % TICK_POLICY
+        string += '%-9s %6s %7s %9s %9s\n' % ('Subsystem', 'Rate', 'Missed',
+                                              'Lag p99', 'Lag max')
+        for name in self.world.SUBSYSTEMS:
+            clock = self.world.clocks[name]
+            string += '%-9s %6s %7s %9s %9s\n' % (name, '%g/s' % (1 / clock.interval),
+                                                  clock.missed,
+                                                  ms(clock.lags.percentile(99)),
+                                                  ms(clock.lags.max()))
+        string += 'Turns on record: %s\n' % len(profiler)
+        string += '%-9s %9s %9s %9s %9s\n' % ('Phase', 'p50', 'p95', 'p99', 'max')
+        for name in profiler.PHASES + ['turn']:
+            sample = profiler.phases[name]
+            string += '%-9s %9s %9s %9s %9s\n' % (name, ms(sample.percentile(50)),
+                                                  ms(sample.percentile(95)),
+                                                  ms(sample.percentile(99)),
+                                                  ms(sample.max()))
+        string += '%-11s %7s %9s %9s %9s\n' % ('Counter', 'p50', 'p95', 'p99', 'max')
+        for name in profiler.COUNTERS:
+            sample = profiler.counters[name]
+            values = [sample.percentile(50), sample.percentile(95),
+                      sample.percentile(99), sample.max()]
+            string += '%-11s %7s %9s %9s %9s\n' % tuple([name] +
+                      [value is None and '-' or value for value in values])
+        if turns:
+            string += 'Slowest of the last %s turns:\n' % turns
+        else:
+            string += 'Slowest of all turns on record:\n'
+        for kind in ['commands', 'areas', 'battles']:
+            slowest = profiler.slowest(kind, turns)
+            if slowest:
+                string += '  %s: %s\n' % (kind.capitalize(),
+                          ', '.join(['%s (%s)' % (name, ms(seconds)) for name, seconds in slowest]))
+            else:
+                string += '  %s: none\n' % kind.capitalize()
+        string += '-' * 50
+        self.pc.update_output(string)
+    
+
+command_list.register(Lag, ['lag'])
+command_help.register(Lag.help, ['lag'])
+
 
 # **************** Command Specific Exceptions *******************
 class SaleFail(Exception):
@@ -0,0 +1,79 @@
+from collections import OrderedDict
+import time
+
+class TokenBucket(object):
+    """A token bucket: holds up to burst tokens, and refills at rate tokens
+    per second.
+    """
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.last = now
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def take(self, now):
+        """Take a token from the bucket. Returns False if there weren't any
+        left.
+        """
+        self.refill(now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class Admission(object):
+    """Admission decides whether a newly accepted connection gets to become a
+    player, before we've spent anything on it.
+
+    Each source address gets a token bucket, so a single host can only open
+    connections at rate per second (after an initial burst), and there's a
+    global cap on how many connections may be sitting at the login prompt at
+    once.
+    """
+    # How many buckets we keep before clearing out the ones that have filled
+    # back up (since a full bucket is the same as no bucket at all), and then
+    # the ones we've heard from least recently
+    MAX_BUCKETS = 1024
+
+    def __init__(self, rate, burst, max_prelogin):
+        self.rate = rate
+        self.burst = burst
+        self.max_prelogin = max_prelogin
+        self.buckets = OrderedDict() # least recently used first
+
+    def admit(self, host, prelogin, now=None):
+        """Decide whether to let in a connection from host, given the number
+        of connections that are already logging in. Returns None if the
+        connection is allowed, or the reason it isn't.
+        """
+        if now is None:
+            now = time.time()
+        if prelogin >= self.max_prelogin:
+            return 'too many connections logging in'
+        bucket = self.buckets.pop(host, None)
+        if not bucket:
+            if len(self.buckets) >= self.MAX_BUCKETS:
+                self.prune(now)
+                while len(self.buckets) >= self.MAX_BUCKETS:
+                    # We're hearing from too many addresses to keep track of;
+                    # forget the one we heard from longest ago
+                    self.buckets.popitem(last=False)
+            bucket = TokenBucket(self.rate, self.burst, now)
+        # (Re)insert the bucket, so it's now the most recently used
+        self.buckets[host] = bucket
+        if not bucket.take(now):
+            return 'connecting too often'
+        return None
+
+    def prune(self, now):
+        """Forget the buckets that have filled back up."""
+        for host, bucket in self.buckets.items():
+            bucket.refill(now)
+            if bucket.tokens >= bucket.burst:
+                del self.buckets[host]
+
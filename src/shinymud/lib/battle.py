@@ -37,12 +37,20 @@ class Battle(object):
         self.world = World.get_world()
     active = lambda self: len(self.teamA) > 0 and len(self.teamB) > 0
     
-    def perform_round(self):
+    def __str__(self):
+        return 'Battle %s (%s vs. %s)' % (self.id,
+                                         ', '.join([char.fancy_name() for char in self.teamA]),
+                                         ', '.join([char.fancy_name() for char in self.teamB]))
+    
+    def perform_round(self, ticks=1):
+        """Fight a round of the battle. ticks is the number of ticks the round
+        counts for (see TICK_POLICY); everyone gets an ATK point for each.
+        """
         ready_characters = []
         ready_characters.extend(self.teamA)
         ready_characters.extend(self.teamB)
         for character in ready_characters:
-            character.atk += 1.0
+            character.atk += 1.0 * ticks
             self.world.log.debug("%s has %s ATK points" % (character.fancy_name(), str(character.atk)))
         while len(ready_characters) and self.active():
             # while we have someone ready to attack AND both teams are still active
@@ -84,5 +92,5 @@ class Battle(object):
         r.extend(self.teamB[:])
         for player in r:
             if player.name not in exclude:
-                player.update_output(message)
+                player.update_output(message, critical=False)
         
\ No newline at end of file
@@ -0,0 +1,96 @@
+import sys
+import time
+
+from shinymud.lib.stats import RollingSample
+
+def _find_monotonic():
+    """Find a clock that never goes backwards (or jumps forwards) when
+    someone sets the system time. Python 2 doesn't have time.monotonic, so
+    on Linux we go straight to clock_gettime(CLOCK_MONOTONIC); anywhere else
+    we make do with time.time.
+    """
+    if hasattr(time, 'monotonic'):
+        return time.monotonic
+    if not sys.platform.startswith('linux'):
+        return time.time
+    try:
+        import ctypes
+        class timespec(ctypes.Structure):
+            _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+        CLOCK_MONOTONIC = 1
+        try:
+            clock_gettime = ctypes.CDLL('libc.so.6', use_errno=True).clock_gettime
+        except AttributeError:
+            # (Older versions of glibc keep it in librt)
+            clock_gettime = ctypes.CDLL('librt.so.1', use_errno=True).clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+    except (ImportError, OSError, AttributeError):
+        return time.time
+    def monotonic():
+        t = timespec()
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+            return time.time()
+        return t.tv_sec + t.tv_nsec * 1e-9
+    return monotonic
+
+monotonic = _find_monotonic()
+
+
+class TickClock(object):
+    """Keeps a steady beat of rate ticks per second.
+
+    Ticks are scheduled on a fixed grid (start, start + interval, start +
+    2 * interval, ...), rather than an interval after the last tick
+    finished, so a slow tick doesn't push every tick after it back. When
+    we're running so late that we've missed ticks altogether, policy decides
+    what happens:
+        'skip' - the missed ticks are dropped, and the game just runs one
+        'catchup' - the missed ticks are run back to back (up to
+            max_catchup of them), so the game catches up with the clock
+        'scale' - one tick is run, but anything measured in ticks (battle
+            rounds, effect durations) counts it as the number of ticks that
+            have gone by (up to max_catchup)
+    Any ticks beyond max_catchup are dropped under every policy.
+    """
+    def __init__(self, rate, policy='skip', max_catchup=4, now=None, history=1000):
+        self.interval = 1.0 / rate
+        self.policy = policy
+        self.max_catchup = max_catchup
+        if now is None:
+            now = monotonic()
+        self.next_tick = now
+        # How late the current tick started
+        self.lag = 0
+        self.lags = RollingSample(history)
+        self.ticks = 0
+        self.missed = 0
+
+    def due(self, now=None):
+        """Return True if it's time for the next tick."""
+        if now is None:
+            now = monotonic()
+        return now >= self.next_tick
+
+    def start_tick(self, now=None):
+        """Start the tick that's due (or overdue). Returns (runs, scale):
+        the number of times the tick should be run, and how many ticks each
+        run should count for.
+        """
+        if now is None:
+            now = monotonic()
+        self.lag = max(0, now - self.next_tick)
+        self.lags.add(self.lag)
+        due = int(self.lag / self.interval) + 1
+        counted = min(due, self.max_catchup)
+        if self.policy == 'catchup':
+            runs, scale = counted, 1
+        elif self.policy == 'scale':
+            runs, scale = 1, counted
+        else:
+            runs, scale = 1, 1
+        self.missed += due - runs * scale
+        self.ticks += due
+        # Stay on the grid, whatever we've decided to run
+        self.next_tick += due * self.interval
+        return runs, scale
+
@@ -5,79 +5,93 @@ import threading
 import socket
 import time
 
-class WebsocketHandler(threading.Thread):
+class ConnectionHandler(object):
+    """A ConnectionHandler owns a listening socket, which it hands to the
+    world's reactor. Whenever the reactor says the listener is readable, the
+    handler accepts the waiting connections, creates a Player object for
+    each player logging in, and adds that Player object to the world.
+    Connections that the world's admission control turns away (see
+    CONNECT_RATE and MAX_PRELOGIN in the config file) are closed right away.
+    
+    Subclasses must implement new_connection(conn_info), which should wrap
+    the newly accepted socket in the appropriate ShinyConnection.
+    """
     
     def __init__(self, port, host, world):
-        threading.Thread.__init__(self)
         self.world = world
         self.host = host
         self.port = port
-        self.daemon = True # So this thread will exit when the main thread does
         self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.listener.bind((host, port))
-        self.world.log.info("WebsocketHandler running on host: %s and port: %s." % (host, port))
+        self.listener.setblocking(0)
+        self.world.log.info("%s running on host: %s and port: %s." % 
+                            (self.__class__.__name__, host, port))
     
-    def run(self):
-        """Start the connection-handler thread running.
-        This thread will accept connections, create a Player object for the
-        player logging in, and then add that Player object to the world.
-        """
-        
+    def start(self):
+        """Start listening for connections."""
         self.listener.listen(5)
+        self.world.reactor.register(self)
         self.world.log.debug("Listener started")
+    
+    def fileno(self):
+        return self.listener.fileno()
+    
+    def handle_read(self):
+        """Accept every connection that is waiting on our listener."""
         while 1:
             try:
-                connection = WebsocketConnection( self.listener.accept(), 
-                                                    self.world.log, self.host, self.port)
+                conn_info = self.listener.accept()
+            except socket.error, e:
+                if e.args[0] not in RETRY_ERRORS:
+                    self.world.log.debug(str(e))
+                return
+            reason = self.world.admission.admit(conn_info[1][0], self.world.prelogin_count)
+            if reason:
+                # Turn them away before we spend anything else on them
+                self.world.log.info('%s: Rejected connection from %s (%s).' %
+                                    (self.__class__.__name__, str(conn_info[1]), reason))
+                self.world.net_stats['rejected'] += 1
+                conn_info[0].close()
+                continue
+            try:
+                connection = self.new_connection(conn_info)
             except Exception, e:
                 self.world.log.debug(str(e))
+                conn_info[0].close()
             else:
-                new_player = Player(connection)
-                self.world.log.info("Websocket: Client logging in from: %s" % str(connection.addr))
-                # new_player.conn.setblocking(0)
-                # The player_add function in the world requires access to the player_list,
-                # which the main thread edits quite a bit -- that's why we need a lock 
-                # before we add a player
-                self.world.player_list_lock.acquire()
-                self.world.player_add(new_player)
-                self.world.player_list_lock.release()
+                connection.player = Player(connection)
+                connection.player.logging_in = True
+                self.world.prelogin_count += 1
+                self.world.player_add(connection.player)
+    
+    def handle_write(self):
+        pass
+    
+    def handle_error(self):
+        self.world.log.error('%s stopped listening on port %s.' % 
+                             (self.__class__.__name__, self.port))
+    
+    def new_connection(self, conn_info):
+        raise NotImplementedError
     
 
-
-class TelnetHandler(threading.Thread):
+class WebsocketHandler(ConnectionHandler):
     
-    def __init__(self, port, host, world):
-        threading.Thread.__init__(self)
-        self.world = world
-        self.daemon = True # So this thread will exit when the main thread does
-        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.listener.bind((host, port))
-        self.world.log.info("TelnetHandler running on host: %s and port: %s." % (host, port))
+    def new_connection(self, conn_info):
+        connection = WebsocketConnection(conn_info, self.world.log, self.host,
+                                         self.port, self.world.reactor)
+        self.world.log.info("Websocket: Client logging in from: %s" % str(connection.addr))
+        return connection
     
-    def run(self):
-        """Start the connection-handler thread running.
-        This thread will accept connections, create a Player object for the
-        player logging in, and then add that Player object to the world.
-        """
-        
-        self.listener.listen(5)
-        self.world.log.debug("Listener started")
-        while 1:
-            try:
-                connection = TelnetConnection(self.listener.accept(), self.world.log)
-            except Exception, e:
-                self.world.log.debug(str(e))
-            else:
-                new_player = Player(connection)
-                self.world.log.info("Telnet: Client logging in from: %s" % str(connection.addr))
-                # The player_add function in the world requires access to the player_list,
-                # which the main thread edits quite a bit -- that's why we need a lock 
-                # before we add a player
-                self.world.player_list_lock.acquire()
-                self.world.player_add(new_player)
-                self.world.player_list_lock.release()
+
+
+class TelnetHandler(ConnectionHandler):
+    
+    def new_connection(self, conn_info):
+        connection = TelnetConnection(conn_info, self.world.log, self.world.reactor)
+        self.world.log.info("Telnet: Client logging in from: %s" % str(connection.addr))
+        return connection
     
 
 
@@ -1,70 +1,328 @@
-import re
-import hashlib
+import time
+import zlib
+import json
 from struct import pack
+from collections import deque
 from socket import error as socket_error
+from errno import EAGAIN, EWOULDBLOCK, EINTR
+from shinymud.lib.connection_handlers.telnet import *
+from shinymud.lib.connection_handlers.websocket import *
+from shinymud.data.config import MCCP_ENABLED, MCCP_LEVEL, MCCP_WINDOW_BITS, MCCP_MEM_LEVEL, \
+                                  WEBSOCKET_DEFLATE, WEBSOCKET_MAX_MESSAGE, \
+                                  WEBSOCKET_PING_INTERVAL, WEBSOCKET_PING_TIMEOUT, GMCP_ENABLED
 
-class ShinyConnection(object):
+# Socket errors that just mean "try again later" on a non-blocking socket
+RETRY_ERRORS = (EAGAIN, EWOULDBLOCK, EINTR)
+
+def to_bytes(line):
+    """Make sure a line of output is a byte string that's ready for the wire."""
+    if isinstance(line, unicode):
+        return line.encode('utf-8')
+    return line
+
+class OutputBuffer(object):
+    """The bytes that are waiting to be written to a connection's socket.
     
-    def __init__(self, conn_info, log):
-        self.conn, self.addr = conn_info
-        self.log = log
+    Payloads are appended as whole chunks; when the socket is ready, every
+    chunk that's waiting is coalesced into a single payload so that it goes
+    out in one send. The socket may not take all of it (it's non-blocking),
+    so we remember how far into the first chunk we've gotten and pick up
+    from there next time.
+    """
+    def __init__(self):
+        self.chunks = deque()
+        self.offset = 0
+        self.size = 0
+        self.queued = 0 # Total bytes ever queued, for the stats
     
-    def send(self):
-        pass
+    def __len__(self):
+        return self.size
+    
+    def append(self, data):
+        if data:
+            self.chunks.append(data)
+            self.size += len(data)
+            self.queued += len(data)
+    
+    def flush(self, sock):
+        """Write as much of the buffer as sock will take with one send, and
+        return the number of bytes written. Socket errors are left for the
+        caller to deal with.
+        """
+        if not self.size:
+            return 0
+        if len(self.chunks) > 1:
+            # Joining keeps our offset valid, since it only covers part of
+            # the first chunk
+            self.chunks = deque([''.join(self.chunks)])
+        sent = sock.send(memoryview(self.chunks[0])[self.offset:])
+        self.size -= sent
+        self.offset += sent
+        if self.offset == len(self.chunks[0]):
+            self.chunks.popleft()
+            self.offset = 0
+        return sent
     
-    def recv(self):
-        pass
-
 
-class TelnetConnection(ShinyConnection):
+class OutputBacklog(object):
+    """The lines of output that are being held back from a stalled
+    connection (one that has more than OUTPUT_HIGH_WATER bytes waiting to be
+    written). The backlog is kept under limit bytes according to policy:
+        'drop' - the oldest non-critical lines are thrown away
+        'collapse' - a line that repeats the line before it is folded into
+            it, and then the oldest non-critical lines are thrown away
+        'disconnect' - the same as 'drop'; the player is also disconnected
+            if they stay stalled for too long (see Player.check_backlog)
+    Critical lines are never dropped to stay under limit, but they can't
+    pile up forever either: past ceiling bytes the oldest lines are dropped
+    whatever they are, and overflowed is set.
+    """
+    def __init__(self, policy, limit, ceiling=None):
+        self.policy = policy
+        self.limit = limit
+        self.ceiling = ceiling or limit * 4
+        self.entries = deque() # [line, critical, repeats]
+        self.size = 0
+        self.overflowed = False
     
-    win_change_regexp = re.compile(r"\xff\xfa\x1f(?P<size>.*?)\xff\xf0")
+    def add(self, line, critical=True):
+        """Add a line to the backlog. Returns the number of bytes that had
+        to be dropped to stay under the limit.
+        """
+        if self.policy == 'collapse' and self.entries and self.entries[-1][0] == line:
+            self.entries[-1][2] += 1
+            return len(line)
+        self.entries.append([line, critical, 1])
+        self.size += len(line)
+        dropped = 0
+        while self.size > self.limit:
+            for entry in self.entries:
+                if not entry[1]:
+                    self.entries.remove(entry)
+                    self.size -= len(entry[0])
+                    dropped += len(entry[0]) * entry[2]
+                    break
+            else:
+                # Everything left is critical; hang on to it
+                break
+        while self.size > self.ceiling and len(self.entries) > 1:
+            self.overflowed = True
+            line, critical, repeats = self.entries.popleft()
+            self.size -= len(line)
+            dropped += len(line) * repeats
+        return dropped
     
-    def __init__(self, conn_info, log):
-        ShinyConnection.__init__(self, conn_info, log)
-        self.win_size = (80,40)
-        self.set_telnet_options()
-        # Put our socket into non-blocking mode - we'll periodically poll for data
-        # instead of blocking until we get it
+    def lines(self):
+        """Return the lines in the backlog (and empty it)."""
+        lines = []
+        for line, critical, repeats in self.entries:
+            if repeats > 1:
+                line = '%s (x%d)' % (line, repeats)
+            lines.append(line)
+        self.entries.clear()
+        self.size = 0
+        return lines
+    
+
+class ShinyConnection(object):
+    # How often (in seconds) keepalive should be called, for protocols that
+    # need it
+    KEEPALIVE_INTERVAL = None
+    
+    def __init__(self, conn_info, log, reactor=None):
+        self.conn, self.addr = conn_info
+        self.log = log
+        self.reactor = reactor
+        self.player = None
+        self.lines = []
+        # When the oldest line that hasn't been answered yet arrived
+        self.input_time = None
+        self.closed = False
+        self.outbuf = OutputBuffer()
+        self.want_write = False
+        # Whether the client is listening to our out-of-band channel, and
+        # which packages it wants from it (None means all of them)
+        self.oob_enabled = False
+        self.oob_supports = None
+        self.fd = self.conn.fileno()
+        # Put our socket into non-blocking mode - the reactor will tell us
+        # when there is data to read instead of us blocking until we get it
         self.conn.setblocking(0)
+        if self.reactor:
+            self.reactor.register(self)
+    
+    def fileno(self):
+        return self.fd
     
     def send(self, queue):
-        try:
-            for index, line in enumerate(queue):
-                if index != (len(queue) - 1):
-                    line += '\r\n'
-                self.conn.send(line)
-            del queue[:]
-        except socket_error:
-            # If we die here, it's probably because we got a broken pipe...
-            # tell the function that's calling us we're not alive anymore
+        """Queue everything in queue up to be sent to the client, and send as
+        much of it as we can right now. Returns False if the connection is no
+        longer alive.
+        """
+        pass
+    
+    def flush(self):
+        """Write as much pending output as the socket will take. Returns False
+        if the connection is no longer alive.
+        """
+        if self.closed:
             return False
-        else:
-            return True
+        try:
+            self.outbuf.flush(self.conn)
+        except socket_error, e:
+            if e.args[0] not in RETRY_ERRORS:
+                # If we die here, it's probably because we got a broken pipe...
+                self.handle_error()
+                return False
+        # Only ask the reactor to tell us about writability while we have
+        # something left to write
+        want_write = len(self.outbuf) > 0
+        if self.reactor and want_write != self.want_write:
+            self.reactor.set_writable(self, want_write)
+            self.want_write = want_write
+        return True
     
     def recv(self):
+        """Return the list of lines that have arrived since the last call
+        to recv, False if nothing has arrived, or None if the client has
+        disconnected.
+        """
+        if self.lines:
+            lines = self.lines
+            self.lines = []
+            return lines
+        if self.closed:
+            return None
+        return False
+    
+    def handle_read(self):
+        """Read whatever our socket has for us. This is called by the reactor,
+        and only when the socket is readable, so we never poll idle clients.
+        """
         try:
-            new_stuff = self.conn.recv(256)
-        except socket_error:
-            # In non-blocking mode, recv generates an error if it doesn't find
-            # any data to recieve. We want to ignore that error and quitely wait until
-            # there is data.
-            return False
+            new_stuff = self.conn.recv(4096)
+        except socket_error, e:
+            if e.args[0] in RETRY_ERRORS:
+                return
+            new_stuff = ''
+        if new_stuff:
+            self.process_input(new_stuff)
+            if len(self.outbuf) and not self.want_write:
+                # Answer anything the protocol needed answering right away
+                self.flush()
+            if self.lines:
+                if self.input_time is None:
+                    self.input_time = time.time()
+                if self.reactor:
+                    self.reactor.input_ready(self)
         else:
-            # Get rid of the \r \n line terminators
-            new_stuff = new_stuff.replace('\n', '').replace('\r', '')
-            # See if the input is a notice of window size change
-            self.parse_winchange(new_stuff)
-            # Ignore any other telnet negotiations
-            new_stuff = re.sub(r"\xff((\xfa.*?\xf0)|(..))", '', new_stuff)
-            if new_stuff:
-                return new_stuff
+            # An empty read means the client has hung up on us
+            self.handle_error()
+    
+    def handle_write(self):
+        self.flush()
+    
+    def handle_error(self):
+        """Stop listening to this connection, and let recv tell the player
+        we're not alive anymore.
+        """
+        self.closed = True
+        if self.reactor:
+            self.reactor.unregister(self)
+            # Wake our player up, so they notice
+            self.reactor.input_ready(self)
+    
+    def process_input(self, data):
+        """Turn raw data from the socket into lines in self.lines."""
+        pass
+    
+    def keepalive(self):
+        """Called every KEEPALIVE_INTERVAL seconds, for protocols that need
+        to check up on an otherwise quiet client.
+        """
+        pass
+    
+    def send_oob(self, package, data):
+        """Queue an out-of-band message (e.g. 'Char.Vitals', {'hp': 10}) for
+        the client. It goes out with the next send or flush.
+        """
+        pass
+    
+    def oob_wanted(self, package):
+        """Return True if the client wants to hear about package."""
+        if not self.oob_enabled:
             return False
+        if self.oob_supports is None:
+            return True
+        for supported in self.oob_supports:
+            if package == supported or package.startswith(supported + '.'):
+                return True
+        return False
     
+    def handle_oob(self, package, data):
+        """Handle an out-of-band message from the client. The only messages
+        we care about are the ones that say which packages it supports, e.g.
+        Core.Supports.Set ["Char 1", "Room 1"].
+        """
+        if not package.startswith('Core.Supports.') or not isinstance(data, list):
+            return
+        modules = set([str(module).split()[0] for module in data if str(module).strip()])
+        if package == 'Core.Supports.Set':
+            self.oob_supports = modules
+        elif package == 'Core.Supports.Add':
+            self.oob_supports = (self.oob_supports or set()) | modules
+        elif package == 'Core.Supports.Remove' and self.oob_supports is not None:
+            self.oob_supports -= modules
     
     def close(self):
+        self.handle_error()
         self.conn.close()
     
+
+class TelnetConnection(ShinyConnection):
+    
+    def __init__(self, conn_info, log, reactor=None):
+        ShinyConnection.__init__(self, conn_info, log, reactor)
+        self.win_size = (80,40)
+        self.compressor = None
+        self.raw_bytes = 0 # Bytes we've been given to send
+        self.compressed_bytes = 0 # What those bytes came to after MCCP
+        self.options = TelnetOptions(self.write, self.option_changed,
+                                     remote=(LINEMODE, NAWS))
+        self.decoder = TelnetDecoder(self.options.receive, self.handle_subnegotiation)
+        self.set_telnet_options()
+    
+    def send(self, queue):
+        # The whole queue goes out as a single payload, one line per CRLF
+        self.write('\r\n'.join([to_bytes(line) for line in queue]))
+        del queue[:]
+        return self.flush()
+    
+    def write(self, data):
+        """Queue data to be sent to the client, compressing it if MCCP is on.
+        Each write is flushed through the compressor (Z_SYNC_FLUSH), so the
+        client can decompress and display everything we've written so far.
+        """
+        if self.compressor and data:
+            self.raw_bytes += len(data)
+            data = self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+            self.compressed_bytes += len(data)
+        self.outbuf.append(data)
+    
+    def compression_ratio(self):
+        """Return how many bytes of output we've saved per byte sent with
+        MCCP (e.g. 4.0 means output is a quarter of its original size), or
+        None if MCCP hasn't been used on this connection.
+        """
+        if not self.compressed_bytes:
+            return None
+        return float(self.raw_bytes) / self.compressed_bytes
+    
+    def process_input(self, new_stuff):
+        # The decoder hands telnet negotiations off as it finds them, and
+        # gives us back whatever complete lines the client has sent
+        self.lines.extend(self.decoder.feed(new_stuff))
+    
     def set_telnet_options(self):
         """Petition client to run in linemode and to send window size change
         notifications.
@@ -72,155 +330,263 @@ class TelnetConnection(ShinyConnection):
         (they transmit each character as they receive it from the player). We want
         them to switch to linemode in this case, where they transmit each line
         after it's been assembled. We also wan't the client to tell us their
-        screen size so we can display things appropriately.
+        screen size so we can display things appropriately. If MCCP is enabled,
+        we also offer to compress our output, and if GMCP is enabled, we offer
+        an out-of-band channel for the player's vitals, location, etc.
+        We don't wait around for the client's answers -- they arrive with the
+        rest of the client's input, and are applied by option_changed and
+        handle_subnegotiation whenever they show up.
         """
-        # IAC + WILL + LINEMODE
-        self.conn.send(chr(255) + chr(251) + chr(34) + '\r\n')
-        # We should get a response from their client (immediately)
-        self.conn.settimeout(1.0)
-        try:
-            result = list(self.conn.recv(256))
-        except socket.timeout:
-            # This just means that their telnet client didn't send us a timely
-            # response to our initiating linemode... we should just move on
-            result = 'Client response FAIL for linemode.'
-        finally:
-            self.log.debug(result)
-            
-        # IAC DO NAWS (Negotiate About Window Size)
-        self.conn.send(chr(255) + chr(253) + chr(31) + '\r\n')
-        try:
-            result = list(self.conn.recv(256))
-        except:
-            result = 'Client response FAIL for NAWS.'
-        else:
-            # IAC WILL NAWS
-            if result[0:3] == ['\xff', '\xfb', '\x1f']:
-                # win, they're willing to do NAWS! Parse their window info
-                stuff = ''.join(result[3:])
-                self.parse_winchange(stuff)
-        finally:
-            self.conn.settimeout(None)
-            self.log.debug(str(result))
-    
-    def parse_winchange(self, data):
-        """Parse and set the terminal size of the player."""
-        match = self.win_change_regexp.match(data)
-        if match:
-            size = match.group('size')
-            self.win_size = (ord(size[1]), ord(size[3]))
+        self.options.request(LINEMODE)
+        self.options.request(NAWS)
+        if MCCP_ENABLED:
+            self.options.request(COMPRESS2, remote=False)
+        if GMCP_ENABLED:
+            self.options.request(GMCP, remote=False)
+        self.flush()
+    
+    def option_changed(self, option, remote, enabled):
+        """Called by our TelnetOptions whenever the client agrees to (or
+        stops) performing an option.
+        """
+        if option == LINEMODE and remote and enabled:
+            # Let the client do all of the line editing, and only send us
+            # complete lines
+            self.write(IAC + SB + LINEMODE + LM_MODE + LM_EDIT + IAC + SE)
+        elif option == COMPRESS2 and not remote:
+            if enabled and not self.compressor:
+                # Everything after this subnegotiation is compressed
+                self.write(IAC + SB + COMPRESS2 + IAC + SE)
+                self.compressor = zlib.compressobj(MCCP_LEVEL, zlib.DEFLATED,
+                                                   MCCP_WINDOW_BITS, MCCP_MEM_LEVEL)
+            elif not enabled and self.compressor:
+                # Finishing the stream tells the client compression is over
+                self.outbuf.append(self.compressor.flush(zlib.Z_FINISH))
+                self.compressor = None
+        elif option == GMCP and not remote:
+            self.oob_enabled = enabled
+    
+    def send_oob(self, package, data):
+        if self.oob_enabled:
+            # JSON escapes anything that isn't ASCII, so there's no chance of
+            # an IAC turning up in the message
+            self.write(IAC + SB + GMCP + package + ' ' + json.dumps(data) + IAC + SE)
+    
+    def handle_subnegotiation(self, option, data):
+        """Handle the data of an IAC SB <option> ... IAC SE sequence."""
+        if option == NAWS and len(data) == 4:
+            # The width and height are each sent as two bytes, high byte first
+            self.win_size = (ord(data[0]) * 256 + ord(data[1]),
+                             ord(data[2]) * 256 + ord(data[3]))
+        elif option == GMCP and self.oob_enabled:
+            package, sep, data = data.partition(' ')
+            try:
+                data = data and json.loads(data) or None
+            except ValueError:
+                return
+            self.handle_oob(package, data)
     
-
 
 class WebsocketConnection(ShinyConnection):
-    handshake_string = "HTTP/1.1 101 Web Socket Protocol Handshake\r\n\
-Upgrade: WebSocket\r\n\
-Connection: Upgrade\r\n\
-Sec-WebSocket-Origin: %(origin)s\r\n\
-Sec-WebSocket-Location: ws://%(host)s/\r\n\r\n"
-    
-    def __init__(self, conn_info, log, host, port):
-        ShinyConnection.__init__(self, conn_info, log)
+    """A connection from a web browser (or anything else that speaks the
+    WebSocket protocol, RFC 6455).
+    
+    Each turn's output is sent as a single text message, with lines separated
+    by CRLF (just like telnet). If the client supports permessage-deflate,
+    messages are compressed with a persistent per-connection compressor.
+    Messages from the client may hold any number of lines.
+    
+    Out-of-band messages are JSON objects ({"package": ..., "data": ...}) sent
+    in binary messages, in both directions. The client turns the out-of-band
+    channel on by sending us one (Core.Hello or Core.Supports.Set, say).
+    """
+    # The most we'll put up with for the client's HTTP upgrade request
+    MAX_HANDSHAKE = 8192
+    KEEPALIVE_INTERVAL = 5
+    
+    def __init__(self, conn_info, log, host, port, reactor=None):
         self.host = host
         self.port = port
-        self.data_fragment = ''
-        self.handshake()
-        self.conn.setblocking(0)
+        self.handshake_data = ''
+        self.handshake_done = False
+        self.pending = []
+        self.decoder = FrameDecoder(WEBSOCKET_MAX_MESSAGE)
+        self.deflater = None
+        self.inflater = None
+        self.last_heard = time.time()
+        self.ping_sent = None
+        ShinyConnection.__init__(self, conn_info, log, reactor)
     
     def send(self, queue):
-        try:
-            while (len(queue) > 0):
-                line = queue.pop(0)
-                line = '\x00' + line.encode('utf-8') + '\xFF'
-                self.conn.send(line)
-        except socket_error:
-            # If we die here, it's probably because we got a broken pipe...
-            # tell the function that's calling us we're not alive anymore 
-            return False
+        if not self.handshake_done:
+            # We can't send anything until the client has finished its
+            # handshake
+            self.pending.extend(queue)
+            del queue[:]
+            return not self.closed
+        self.write(OP_TEXT, '\r\n'.join([to_bytes(line) for line in queue]))
+        del queue[:]
+        return self.flush()
+    
+    def write(self, opcode, payload):
+        """Queue a message to be sent to the client, compressing it if
+        permessage-deflate is on.
+        """
+        if self.deflater:
+            payload = self.deflater.compress(payload) + self.deflater.flush(zlib.Z_SYNC_FLUSH)
+            self.outbuf.append(encode_frame(opcode, payload[:-len(DEFLATE_TAIL)], True))
         else:
-            return True
+            self.outbuf.append(encode_frame(opcode, payload))
     
+    def send_oob(self, package, data):
+        if self.oob_enabled and self.handshake_done:
+            self.write(OP_BINARY, json.dumps({'package': package, 'data': data}))
     
-    def recv(self):
+    def process_input(self, data):
+        self.last_heard = time.time()
+        self.ping_sent = None
+        if not self.handshake_done:
+            data = self.handshake_data + data
+            head, sep, data = data.partition('\r\n\r\n')
+            if not sep:
+                self.handshake_data = head
+                if len(head) > self.MAX_HANDSHAKE:
+                    self.reject('431 Request Header Fields Too Large')
+                return
+            self.handshake_data = ''
+            self.handshake(head)
+            if not self.handshake_done:
+                return
         try:
-            new_stuff = self.data_fragment + self.conn.recv(256)
-        except socket_error:
-            # In non-blocking mode, recv generates an error if it doesn't find
-            # any data to recieve. We want to ignore that error and quitely wait until
-            # there is data.
-            return False
+            messages = self.decoder.feed(data)
+            for opcode, payload, compressed in messages:
+                self.handle_message(opcode, payload, compressed)
+                if self.closed:
+                    return
+        except WebsocketError, e:
+            self.log.error('Websocket: closing connection from %s: %s' % (str(self.addr), str(e)))
+            self.outbuf.append(encode_frame(OP_CLOSE, pack('!H', e.code)))
+            self.flush()
+            self.handle_error()
+    
+    def handle_message(self, opcode, payload, compressed):
+        if compressed:
+            payload = self.inflater.decompress(payload + DEFLATE_TAIL, WEBSOCKET_MAX_MESSAGE)
+            if self.inflater.unconsumed_tail:
+                raise WebsocketError(CLOSE_TOO_BIG, 'Message too big.')
+        if opcode == OP_BINARY:
+            if not GMCP_ENABLED:
+                return
+            try:
+                message = json.loads(payload)
+                package, data = str(message['package']), message.get('data')
+            except (ValueError, TypeError, KeyError):
+                self.log.error('Websocket: bad out-of-band message from %s' % str(self.addr))
+                return
+            self.oob_enabled = True
+            self.handle_oob(package, data)
+        elif opcode == OP_TEXT:
+            for line in payload.split('\n'):
+                line = line.rstrip('\r')
+                if line:
+                    self.lines.append(line)
+        elif opcode == OP_PING:
+            self.outbuf.append(encode_frame(OP_PONG, payload))
+        elif opcode == OP_CLOSE:
+            # Echo the client's status code back, and stop listening to them
+            # so that recv tells the player object to log the player out
+            self.outbuf.append(encode_frame(OP_CLOSE, payload[:2]))
+            self.flush()
+            self.handle_error()
+    
+    def handshake(self, data):
+        """Answer the client's HTTP upgrade request."""
+        request, headers = parse_request(data)
+        key = headers.get('sec-websocket-key')
+        if not (request.startswith('GET ') and key and
+                'websocket' in headers.get('upgrade', '').lower() and
+                headers.get('sec-websocket-version') == '13'):
+            self.reject('400 Bad Request')
+            return
+        response = ['HTTP/1.1 101 Switching Protocols',
+                    'Upgrade: websocket',
+                    'Connection: Upgrade',
+                    'Sec-WebSocket-Accept: ' + accept_key(key)]
+        if WEBSOCKET_DEFLATE:
+            for name, params in parse_extensions(headers.get('sec-websocket-extensions', '')):
+                if name == 'permessage-deflate':
+                    extension = self.negotiate_deflate(params)
+                    if extension:
+                        response.append('Sec-WebSocket-Extensions: ' + extension)
+                        break
+        self.outbuf.append('\r\n'.join(response) + '\r\n\r\n')
+        self.handshake_done = True
+        if self.pending:
+            self.send(self.pending)
         else:
-            valid_lines = []
-            
-            # Split all lines on the terminating character
-            lines = new_stuff.split('\xFF')
-            
-            # Pop the last line off of the end - this will either be an empty string if the
-            # last line was terminated, or a left over fragment that should wait for the next batch
-            # of lines to be processed
-            self.data_fragment = lines.pop()
-            
-            # Now we should make sure the lines have a valid prefix. Ignore any that don't.
-            for line in lines:
-                if line[0] == '\x00':
-                    valid_lines.append(line[1:])
-                elif line == '':
-                    # The client wishes to terminate - send the closing handshake and disconnect
-                    self.close()
-                    # Return None so that the player object knows to log the player out
-                    return None
-                else:
-                    self.log.error('Received invalid message from client '
-                                    '(frame did not begin with 0x00 byte): %s' % (line))
-                
-            if valid_lines:
-                return valid_lines
-            
-            return False
+            self.flush()
     
+    def negotiate_deflate(self, params):
+        """Set up our compressor and decompressor for a permessage-deflate
+        offer, and return our response to it -- or None if we can't accept
+        the offer.
+        """
+        server_bits = MCCP_WINDOW_BITS
+        client_bits = 15
+        response = ['permessage-deflate']
+        try:
+            if params.get('server_max_window_bits'):
+                server_bits = min(server_bits, int(params['server_max_window_bits']))
+            if 'client_max_window_bits' in params:
+                # The client will use a window as small as we like
+                client_bits = MCCP_WINDOW_BITS
+                if params['client_max_window_bits']:
+                    client_bits = min(client_bits, int(params['client_max_window_bits']))
+                response.append('client_max_window_bits=%d' % client_bits)
+        except ValueError:
+            return None
+        if not (9 <= server_bits <= 15 and 9 <= client_bits <= 15):
+            # zlib can't do a raw deflate stream with an 8-bit window
+            return None
+        response.append('server_max_window_bits=%d' % server_bits)
+        if 'server_no_context_takeover' in params:
+            # We'd rather keep our compression context between messages,
+            # since that's where most of the savings come from
+            return None
+        # Negative window bits give us a raw deflate stream, without zlib's
+        # header and checksum
+        self.deflater = zlib.compressobj(MCCP_LEVEL, zlib.DEFLATED, -server_bits, MCCP_MEM_LEVEL)
+        self.inflater = zlib.decompressobj(-client_bits)
+        self.decoder.compression = True
+        return '; '.join(response)
     
-    def handshake(self):
-        data = self.conn.recv(1024)
-        host = re.findall(r'Host: (.*?)\r\n', data)[0]
-        origin = re.findall(r'Origin: (.*?)\r\n', data)[0]
-        response = self.handshake_string % {'origin': origin, 'host': host}
-        
-        response = response.encode('utf-8') + self.parse_hybi00(data)
-        self.conn.send(response)
+    def reject(self, status):
+        self.log.error('Websocket: bad handshake from %s (%s)' % (str(self.addr), status))
+        self.outbuf.append('HTTP/1.1 %s\r\nSec-WebSocket-Version: 13\r\n\r\n' % status)
+        self.flush()
+        self.handle_error()
     
-    def close(self):
-        self.conn.close()
+    def keepalive(self):
+        """Ping the client if we haven't heard from it in a while, and give
+        up on it if it doesn't answer.
+        """
+        if not self.handshake_done or self.closed:
+            return
+        now = time.time()
+        if self.ping_sent:
+            if now - self.ping_sent > WEBSOCKET_PING_TIMEOUT:
+                self.log.info('Websocket: %s stopped answering pings.' % str(self.addr))
+                self.handle_error()
+        elif now - self.last_heard > WEBSOCKET_PING_INTERVAL:
+            self.outbuf.append(encode_frame(OP_PING, ''))
+            self.ping_sent = now
+            self.flush()
     
-    def parse_hybi00(self, request):
-        """ Parses an HTTP request header and forms a response according to
-        The WebSocket protocol, draft-ietf-hybi-thewebsocketprotocol-00
-        (http://tools.ietf.org/html/draft-ietf-hybi-thewebsocketprotocol-00).
-        """
-        # The random tokens will be in the last 8 bytes of the request
-        random_tokens = request[-8:]
-        # Grab the sooper seekret keys hidden away in the request headers
-        key1 = re.findall(r'Sec-WebSocket-Key1: (.*?)\r\n', request)[0]
-        key2 = re.findall(r'Sec-WebSocket-Key2: (.*?)\r\n', request)[0]
-        
-        def parse_key(key):
-            spaces = 0
-            digits = ''
-            
-            for char in list(key):
-                if char.isdigit():
-                    # If the character is a digit, concatonate it to our string of digits
-                    digits += char
-                elif char == ' ':
-                    # If the character is a space, add it to our space counter orgecc
-                    spaces += 1
-            
-            result = int(int(digits) / spaces)
-            return result
-        
-        
-        response = pack('>II8s', parse_key(key1), parse_key(key2), str(random_tokens))
-        hashed_response = hashlib.md5()
-        hashed_response.update(response)
-        return hashed_response.digest()
+    def close(self):
+        if self.handshake_done and not self.closed:
+            # Say goodbye properly
+            self.outbuf.append(encode_frame(OP_CLOSE, pack('!H', CLOSE_NORMAL)))
+            self.flush()
+        ShinyConnection.close(self)
     
 
@@ -0,0 +1,239 @@
+"""Telnet protocol constants and option negotiation (RFC 854, 855, 1143)."""
+
+# Commands
+SE = chr(240)
+NOP = chr(241)
+GA = chr(249)
+SB = chr(250)
+WILL = chr(251)
+WONT = chr(252)
+DO = chr(253)
+DONT = chr(254)
+IAC = chr(255)
+
+# Options
+ECHO = chr(1)
+SGA = chr(3)
+NAWS = chr(31)
+LINEMODE = chr(34)
+COMPRESS2 = chr(86) # MCCP2
+GMCP = chr(201)
+
+# Linemode subnegotiation (RFC 1184)
+LM_MODE = chr(1)
+LM_EDIT = chr(1)
+
+
+class TelnetOptions(object):
+    """Keeps track of which telnet options are enabled on each side of a
+    connection.
+
+    Negotiation follows the "Q method" of RFC 1143, which guarantees that we
+    never get stuck in a loop of agreeing with the client: each side of each
+    option is either 'no', 'yes', 'wantyes' (we asked for it and are waiting
+    for an answer) or 'wantno'. Nothing here ever waits on the client --
+    requests are written out with send, and answers are handed to receive
+    whenever they happen to arrive.
+
+    The local side of an option is the one we perform (WILL/WONT from us,
+    DO/DONT from the client), and the remote side is the one the client
+    performs (DO/DONT from us, WILL/WONT from the client).
+
+    Whenever an option is turned on or off, on_change(option, remote, enabled)
+    is called.
+    """
+    def __init__(self, send, on_change, local=(), remote=()):
+        self.send = send
+        self.on_change = on_change
+        # The options we're willing to have turned on, if the client asks
+        self.supported = {False: set(local), True: set(remote)}
+        self.state = {False: {}, True: {}}
+
+    def enabled(self, option, remote=True):
+        return self.state[remote].get(option, 'no') == 'yes'
+
+    def request(self, option, remote=True):
+        """Ask for an option to be turned on: DO for a remote option, or WILL
+        for a local one.
+        """
+        self.supported[remote].add(option)
+        states = self.state[remote]
+        if states.get(option, 'no') == 'no':
+            states[option] = 'wantyes'
+            self.send(IAC + (remote and DO or WILL) + option)
+
+    def refuse(self, option, remote=True):
+        """Ask for an option to be turned off: DONT for a remote option, or
+        WONT for a local one.
+        """
+        self.supported[remote].discard(option)
+        states = self.state[remote]
+        if states.get(option, 'no') == 'yes':
+            states[option] = 'wantno'
+            self.send(IAC + (remote and DONT or WONT) + option)
+            # We stop using the option right away, whatever the client says
+            self.on_change(option, remote, False)
+
+    def receive(self, command, option):
+        """Handle a WILL, WONT, DO or DONT that the client has sent us."""
+        remote = command in (WILL, WONT)
+        states = self.state[remote]
+        state = states.get(option, 'no')
+        agree, disagree = remote and (DO, DONT) or (WILL, WONT)
+        if command in (WILL, DO):
+            if state == 'no':
+                if option in self.supported[remote]:
+                    states[option] = 'yes'
+                    self.send(IAC + agree + option)
+                    self.on_change(option, remote, True)
+                else:
+                    self.send(IAC + disagree + option)
+            elif state == 'wantyes':
+                states[option] = 'yes'
+                self.on_change(option, remote, True)
+            elif state == 'wantno':
+                # The client is refusing to turn the option off, which it
+                # isn't allowed to do; treat the option as off.
+                states[option] = 'no'
+        else:
+            if state == 'yes':
+                states[option] = 'no'
+                self.send(IAC + disagree + option)
+                self.on_change(option, remote, False)
+            elif state in ('wantyes', 'wantno'):
+                states[option] = 'no'
+
+
+class TelnetDecoder(object):
+    """A streaming decoder for the telnet byte stream coming from a client.
+
+    Data is fed to the decoder as it arrives from the socket, and it keeps
+    its state between reads, so a line or an IAC sequence can be split
+    across any number of reads. Each call to feed returns the complete lines
+    of input that it found (a client sending several lines at once gets
+    several lines back). Lines may be terminated by CR LF, CR NUL, or a bare
+    LF or CR; empty lines are skipped, and overlong ones are cut short at
+    MAX_LINE bytes.
+
+    Telnet commands are taken out of the stream as they're found:
+        on_command(command, option) - called for IAC WILL/WONT/DO/DONT <option>
+        on_subnegotiation(option, data) - called for IAC SB <option> <data>
+            IAC SE (with any doubled IACs in data undone)
+    IAC IAC is an escaped 255 byte of data. Any other IAC command (NOP, GA,
+    etc.) is dropped.
+    """
+    # Stop collecting a subnegotiation after this many bytes, so that a
+    # client that never sends IAC SE can't make us hold on to everything
+    MAX_SUBNEGOTIATION = 1024
+    # Likewise for a line of input that never ends: anything past this many
+    # bytes is thrown away, and the line is cut short
+    MAX_LINE = 4096
+
+    def __init__(self, on_command, on_subnegotiation):
+        self.on_command = on_command
+        self.on_subnegotiation = on_subnegotiation
+        self.state = 'data'
+        self.line = []
+        self.line_size = 0
+        self.cr = False
+        self.command = None
+        self.sb_option = None
+        self.sb_data = []
+        self.sb_size = 0
+
+    def feed(self, data):
+        """Decode the next chunk of bytes from the client, and return a list
+        of the lines it completed.
+        """
+        lines = []
+        i = 0
+        end = len(data)
+        while i < end:
+            state = self.state
+            if state == 'data':
+                # The common case: skip straight to the next IAC, if any
+                j = data.find(IAC, i)
+                if j == -1:
+                    self._text(data[i:], lines)
+                    break
+                self._text(data[i:j], lines)
+                self.state = 'iac'
+                i = j + 1
+            elif state == 'sbdata':
+                j = data.find(IAC, i)
+                if j == -1:
+                    self._sb(data[i:])
+                    break
+                self._sb(data[i:j])
+                self.state = 'sbiac'
+                i = j + 1
+            else:
+                byte = data[i]
+                i += 1
+                if state == 'iac':
+                    self.state = 'data'
+                    if byte == IAC:
+                        self._text(IAC, lines)
+                    elif byte in (WILL, WONT, DO, DONT):
+                        self.command = byte
+                        self.state = 'option'
+                    elif byte == SB:
+                        self.state = 'sb'
+                elif state == 'option':
+                    self.state = 'data'
+                    self.on_command(self.command, byte)
+                elif state == 'sb':
+                    self.sb_option = byte
+                    self.state = 'sbdata'
+                elif state == 'sbiac':
+                    if byte == IAC:
+                        self._sb(IAC)
+                        self.state = 'sbdata'
+                    else:
+                        sb_data = ''.join(self.sb_data)
+                        self.sb_data = []
+                        self.sb_size = 0
+                        self.state = 'data'
+                        self.on_subnegotiation(self.sb_option, sb_data)
+                        if byte != SE:
+                            # The client never finished its subnegotiation;
+                            # treat this as the start of a new command
+                            self.state = 'iac'
+                            i -= 1
+        return lines
+
+    def _text(self, text, lines):
+        if not text:
+            return
+        if self.cr:
+            # We've already ended the line on the CR, so skip the LF (or
+            # NUL) that goes with it
+            self.cr = False
+            if text[0] in '\n\0':
+                text = text[1:]
+        if '\r' in text:
+            self.cr = text.endswith('\r')
+            text = text.replace('\r\n', '\n').replace('\r\0', '\n').replace('\r', '\n')
+        parts = text.split('\n')
+        self._add_text(parts[0])
+        for part in parts[1:]:
+            line = ''.join(self.line)
+            if line:
+                lines.append(line)
+            self.line = []
+            self.line_size = 0
+            self._add_text(part)
+    
+    def _add_text(self, text):
+        room = self.MAX_LINE - self.line_size
+        if len(text) > room:
+            text = text[:room]
+        if text:
+            self.line.append(text)
+            self.line_size += len(text)
+
+    def _sb(self, data):
+        if self.sb_size < self.MAX_SUBNEGOTIATION:
+            self.sb_data.append(data)
+            self.sb_size += len(data)
+
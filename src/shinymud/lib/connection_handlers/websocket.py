@@ -0,0 +1,198 @@
+"""WebSocket protocol (RFC 6455) framing and handshake helpers, along with
+the permessage-deflate extension (RFC 7692).
+"""
+from binascii import hexlify, unhexlify
+from struct import pack, unpack
+import hashlib
+import base64
+
+GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+# Opcodes
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+# Close status codes
+CLOSE_NORMAL = 1000
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_TOO_BIG = 1009
+
+# Every compressed message ends with these bytes (from Z_SYNC_FLUSH), which
+# permessage-deflate leaves off of the wire
+DEFLATE_TAIL = '\x00\x00\xff\xff'
+
+
+class WebsocketError(Exception):
+    """Raised when a client breaks the WebSocket protocol. code is the status
+    code the connection should be closed with.
+    """
+    def __init__(self, code, reason):
+        Exception.__init__(self, reason)
+        self.code = code
+
+
+def accept_key(key):
+    """Return the Sec-WebSocket-Accept value for a client's
+    Sec-WebSocket-Key.
+    """
+    return base64.b64encode(hashlib.sha1(key.strip() + GUID).digest())
+
+def parse_request(data):
+    """Split an HTTP request header block into its request line and a
+    dictionary of its headers (with lower-cased names).
+    """
+    lines = data.split('\r\n')
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        if sep:
+            name = name.strip().lower()
+            if name in headers:
+                # Repeated headers are the same as one comma-separated header
+                headers[name] += ', ' + value.strip()
+            else:
+                headers[name] = value.strip()
+    return lines[0], headers
+
+def parse_extensions(value):
+    """Parse a Sec-WebSocket-Extensions header into a list of
+    (name, {param: value}) offers. A parameter without a value is given a
+    value of None.
+    """
+    offers = []
+    for offer in value.split(','):
+        parts = [part.strip() for part in offer.split(';')]
+        if not parts[0]:
+            continue
+        params = {}
+        for param in parts[1:]:
+            name, sep, val = param.partition('=')
+            params[name.strip()] = sep and val.strip().strip('"') or None
+        offers.append((parts[0], params))
+    return offers
+
+def encode_frame(opcode, payload, rsv1=False):
+    """Return a complete (unfragmented, unmasked) frame, as sent by a
+    server.
+    """
+    first = 0x80 | opcode
+    if rsv1:
+        first |= 0x40
+    length = len(payload)
+    if length < 126:
+        header = pack('!BB', first, length)
+    elif length < 0x10000:
+        header = pack('!BBH', first, 126, length)
+    else:
+        header = pack('!BBQ', first, 127, length)
+    return header + payload
+
+def unmask(payload, key):
+    """Undo the masking a client applies to its frames."""
+    if not payload:
+        return payload
+    length = len(payload)
+    key = (key * (length // 4 + 1))[:length]
+    # XOR the whole payload at once as one big integer
+    result = int(hexlify(payload), 16) ^ int(hexlify(key), 16)
+    return unhexlify('%0*x' % (length * 2, result))
+
+
+class FrameDecoder(object):
+    """A streaming decoder for the frames a client sends us.
+
+    Data is fed to the decoder as it arrives from the socket; each call to
+    feed returns a list of (opcode, payload, compressed) tuples, one for each
+    complete message (with any fragments reassembled) or control frame. If
+    the client breaks the protocol, a WebsocketError is raised.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.buffer = ''
+        # Whether the client may set RSV1 (permessage-deflate was agreed)
+        self.compression = False
+        self.fragments = None
+        self.fragments_size = 0
+        self.message_opcode = None
+        self.message_compressed = False
+
+    def feed(self, data):
+        self.buffer += data
+        messages = []
+        while True:
+            frame = self.next_frame()
+            if not frame:
+                break
+            fin, rsv1, opcode, payload = frame
+            if opcode >= OP_CLOSE:
+                if not fin or len(payload) > 125:
+                    raise WebsocketError(CLOSE_PROTOCOL_ERROR, 'Bad control frame.')
+                messages.append((opcode, payload, False))
+            elif opcode == OP_CONTINUATION:
+                if self.fragments is None:
+                    raise WebsocketError(CLOSE_PROTOCOL_ERROR, 'Unexpected continuation.')
+                self.add_fragment(payload)
+                if fin:
+                    messages.append((self.message_opcode, ''.join(self.fragments),
+                                     self.message_compressed))
+                    self.fragments = None
+            elif opcode in (OP_TEXT, OP_BINARY):
+                if self.fragments is not None:
+                    raise WebsocketError(CLOSE_PROTOCOL_ERROR, 'Unfinished message.')
+                if fin:
+                    messages.append((opcode, payload, rsv1))
+                else:
+                    self.fragments = []
+                    self.fragments_size = 0
+                    self.message_opcode = opcode
+                    self.message_compressed = rsv1
+                    self.add_fragment(payload)
+            else:
+                raise WebsocketError(CLOSE_PROTOCOL_ERROR, 'Unknown opcode %s.' % opcode)
+        return messages
+
+    def add_fragment(self, payload):
+        self.fragments_size += len(payload)
+        if self.fragments_size > self.max_size:
+            raise WebsocketError(CLOSE_TOO_BIG, 'Message too big.')
+        self.fragments.append(payload)
+
+    def next_frame(self):
+        """Take the next complete frame off of the buffer, and return it as
+        (fin, rsv1, opcode, payload), or None if we don't have all of it yet.
+        """
+        buf = self.buffer
+        if len(buf) < 2:
+            return None
+        first, second = ord(buf[0]), ord(buf[1])
+        fin = bool(first & 0x80)
+        rsv1 = bool(first & 0x40)
+        if first & 0x30 or (rsv1 and not (self.compression and first & 0x0F in (OP_TEXT, OP_BINARY))):
+            raise WebsocketError(CLOSE_PROTOCOL_ERROR, 'Unexpected reserved bits.')
+        if not second & 0x80:
+            raise WebsocketError(CLOSE_PROTOCOL_ERROR, 'Client frames must be masked.')
+        length = second & 0x7F
+        offset = 2
+        if length == 126:
+            if len(buf) < 4:
+                return None
+            length = unpack('!H', buf[2:4])[0]
+            offset = 4
+        elif length == 127:
+            if len(buf) < 10:
+                return None
+            length = unpack('!Q', buf[2:10])[0]
+            offset = 10
+        if length > self.max_size:
+            raise WebsocketError(CLOSE_TOO_BIG, 'Message too big.')
+        if len(buf) < offset + 4 + length:
+            return None
+        key = buf[offset:offset + 4]
+        payload = unmask(buf[offset + 4:offset + 4 + length], key)
+        self.buffer = buf[offset + 4 + length:]
+        return fin, rsv1, first & 0x0F, payload
+
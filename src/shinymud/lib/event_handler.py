@@ -58,9 +58,7 @@ class EventHandler(object):
                         except CommandError, e:
                             self.obj.actionq.append(str(e))
                     else:
-                        cmd = command_list[cmd_name]
-                        if cmd:
-                            self.obj.cmdq.append(cmd(self.obj, args, cmd_name))
+                        self.obj.perform(line)
     
     def personalize(self, replace_dict):
         """Replace a set of word place-holders with their real counterparts."""
@@ -0,0 +1,112 @@
+from collections import deque
+import time
+
+from shinymud.lib.stats import RollingSample
+
+class TurnProfiler(object):
+    """Keeps track of where the world's time goes, turn by turn.
+
+    Each turn is split into phases (npc ticks, player input and commands,
+    output, battles, etc.); the world calls phase(name) at the end of each
+    one, and the time since the last call is charged to it. The last size
+    turns are kept, so we can report percentiles for each phase. Along the
+    way, the world can also charge time to individual commands, areas and
+    battles (see charge), so we can name the slowest ones.
+    """
+    PHASES = ['npcs', 'input', 'cleanup', 'effects', 'battles', 'timers',
+              'resets', 'tasks', 'output']
+    # Things that are counted, rather than timed, each turn (see count and
+    # gauge): how many npcs had commands queued, how many of them were still
+    # waiting for their turn at the end of it, and how many npc commands
+    # were dropped
+    COUNTERS = ['npc_queue', 'npc_waiting', 'npc_drops']
+
+    def __init__(self, size=1000):
+        self.size = size
+        self.phases = dict([(name, RollingSample(size)) for name in self.PHASES + ['turn']])
+        self.counters = dict([(name, RollingSample(size)) for name in self.COUNTERS])
+        self.turn_counts = {}
+        # What was charged to each command, area and battle in each turn
+        self.charges = deque(maxlen=size)
+        self.current = {}
+        self.turn_start = None
+        self.turn_phases = {}
+        self.mark = None
+
+    def __len__(self):
+        return len(self.phases['turn'])
+
+    def start_turn(self, now=None):
+        if now is None:
+            now = time.time()
+        self.turn_start = self.mark = now
+        self.turn_phases = {}
+
+    def phase(self, name, now=None):
+        """Charge the time since the last phase (or the start of the turn)
+        to the phase name.
+        """
+        if now is None:
+            now = time.time()
+        self.turn_phases[name] = self.turn_phases.get(name, 0) + now - self.mark
+        self.mark = now
+
+    def end_turn(self, now=None):
+        """Finish off the turn, and return how long it took."""
+        if now is None:
+            now = time.time()
+        for name in self.PHASES:
+            self.phases[name].add(self.turn_phases.get(name, 0))
+        for name in self.COUNTERS:
+            self.counters[name].add(self.turn_counts.get(name, 0))
+        self.turn_counts = {}
+        total = now - self.turn_start
+        self.phases['turn'].add(total)
+        # Anything charged between turns (commands run as soon as their
+        # input arrives, say) is counted with the turn that follows
+        self.charges.append(self.current)
+        self.current = {}
+        return total
+
+    def slowest_phase(self):
+        """Return the name of the phase that took the longest in the turn
+        we're in (or just finished), and how long it took.
+        """
+        if not self.turn_phases:
+            return None, 0
+        name = max(self.turn_phases, key=self.turn_phases.get)
+        return name, self.turn_phases[name]
+
+    def count(self, name, n=1):
+        """Add n to the counter name for this turn."""
+        self.turn_counts[name] = self.turn_counts.get(name, 0) + n
+
+    def gauge(self, name, value):
+        """Record value for the counter name for this turn, if it's the
+        highest we've seen this turn.
+        """
+        self.turn_counts[name] = max(self.turn_counts.get(name, 0), value)
+
+    def charge(self, kind, name, seconds):
+        """Charge some time to something of the given kind ('commands',
+        'areas' or 'battles') by name.
+        """
+        charges = self.current.setdefault(kind, {})
+        charges[name] = charges.get(name, 0) + seconds
+
+    def slowest(self, kind, turns=None, count=5):
+        """Return the count (name, seconds) pairs of the given kind that were
+        charged the most time in a single turn over the last turns turns
+        (or all of the turns we know about).
+        """
+        worst = {}
+        recent = list(self.charges)
+        if turns:
+            recent = recent[-turns:]
+        for charges in recent:
+            for name, seconds in charges.get(kind, {}).items():
+                if seconds > worst.get(name, 0):
+                    worst[name] = seconds
+        ordered = sorted(worst.items(), key=lambda pair: pair[1], reverse=True)
+        return ordered[:count]
+
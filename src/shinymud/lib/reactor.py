@@ -0,0 +1,181 @@
+import select
+import errno
+import traceback
+
+class EpollPoller(object):
+    """Readiness notification using Linux's epoll."""
+    def __init__(self):
+        self.epoll = select.epoll()
+
+    def _mask(self, write):
+        mask = select.EPOLLIN | select.EPOLLERR | select.EPOLLHUP
+        if write:
+            mask |= select.EPOLLOUT
+        return mask
+
+    def register(self, fd, write=False):
+        self.epoll.register(fd, self._mask(write))
+
+    def modify(self, fd, write=False):
+        self.epoll.modify(fd, self._mask(write))
+
+    def unregister(self, fd):
+        self.epoll.unregister(fd)
+
+    def poll(self, timeout):
+        events = []
+        for fd, mask in self.epoll.poll(timeout):
+            readable = bool(mask & (select.EPOLLIN | select.EPOLLERR | select.EPOLLHUP))
+            events.append((fd, readable, bool(mask & select.EPOLLOUT)))
+        return events
+
+
+class PollPoller(object):
+    """Readiness notification using poll(2), for platforms without epoll."""
+    def __init__(self):
+        self.poller = select.poll()
+
+    def _mask(self, write):
+        mask = select.POLLIN | select.POLLPRI | select.POLLERR | select.POLLHUP
+        if write:
+            mask |= select.POLLOUT
+        return mask
+
+    def register(self, fd, write=False):
+        self.poller.register(fd, self._mask(write))
+
+    def modify(self, fd, write=False):
+        self.poller.register(fd, self._mask(write))
+
+    def unregister(self, fd):
+        self.poller.unregister(fd)
+
+    def poll(self, timeout):
+        events = []
+        # poll(2) takes its timeout in milliseconds
+        for fd, mask in self.poller.poll(int(timeout * 1000)):
+            readable = bool(mask & (select.POLLIN | select.POLLPRI |
+                                    select.POLLERR | select.POLLHUP | select.POLLNVAL))
+            events.append((fd, readable, bool(mask & select.POLLOUT)))
+        return events
+
+
+class SelectPoller(object):
+    """Readiness notification using plain select(2), the lowest common
+    denominator.
+    """
+    def __init__(self):
+        self.readers = set()
+        self.writers = set()
+
+    def register(self, fd, write=False):
+        self.readers.add(fd)
+        self.modify(fd, write)
+
+    def modify(self, fd, write=False):
+        if write:
+            self.writers.add(fd)
+        else:
+            self.writers.discard(fd)
+
+    def unregister(self, fd):
+        self.readers.discard(fd)
+        self.writers.discard(fd)
+
+    def poll(self, timeout):
+        r, w, x = select.select(self.readers, self.writers, self.readers, timeout)
+        readable = set(r) | set(x)
+        writable = set(w)
+        return [(fd, fd in readable, fd in writable) for fd in readable | writable]
+
+
+def get_poller():
+    """Return the most efficient poller this platform supports."""
+    if hasattr(select, 'epoll'):
+        return EpollPoller()
+    if hasattr(select, 'poll'):
+        return PollPoller()
+    return SelectPoller()
+
+class Reactor(object):
+    """The Reactor multiplexes all of the world's sockets (both the listening
+    sockets of the connection handlers and the sockets of connected clients),
+    and dispatches to them only when they are ready.
+
+    Anything registered with the Reactor must provide the following functions:
+        fileno() - the file descriptor to watch
+        handle_read() - called when the file descriptor is readable
+        handle_write() - called when the file descriptor is writable (only if
+            it was registered or modified with write=True)
+        handle_error() - called if handle_read or handle_write raises an
+            exception; the handler is unregistered first.
+    """
+    def __init__(self, log):
+        self.log = log
+        self.poller = get_poller()
+        self.handlers = {}
+        self.ready = []
+
+    def register(self, handler, write=False):
+        fd = handler.fileno()
+        self.handlers[fd] = handler
+        self.poller.register(fd, write)
+
+    def set_writable(self, handler, write=True):
+        """Start (or stop) watching a handler's socket for writability."""
+        fd = handler.fileno()
+        if fd in self.handlers:
+            self.poller.modify(fd, write)
+
+    def unregister(self, handler):
+        fd = handler.fileno()
+        if self.handlers.get(fd) is handler:
+            del self.handlers[fd]
+            try:
+                self.poller.unregister(fd)
+            except (IOError, OSError, KeyError, ValueError):
+                # The socket may have been closed out from under us already
+                pass
+
+    def input_ready(self, handler):
+        """Note that a handler has received new input since the last call
+        to pop_ready.
+        """
+        self.ready.append(handler)
+
+    def pop_ready(self):
+        """Return (and forget) the handlers that have received input."""
+        ready = self.ready
+        self.ready = []
+        return ready
+
+    def poll(self, timeout):
+        """Wait up to timeout seconds for socket activity, and dispatch any
+        events to their handlers. Returns the number of events handled.
+        """
+        try:
+            events = self.poller.poll(timeout)
+        except (select.error, IOError, OSError), e:
+            if e.args[0] == errno.EINTR:
+                return 0
+            raise
+        for fd, readable, writable in events:
+            if readable:
+                self._dispatch(fd, 'handle_read')
+            if writable:
+                self._dispatch(fd, 'handle_write')
+        return len(events)
+
+    def _dispatch(self, fd, event):
+        handler = self.handlers.get(fd)
+        if not handler:
+            # This handler was unregistered by an earlier event this poll
+            return
+        try:
+            getattr(handler, event)()
+        except Exception:
+            self.log.error('Reactor: %s failed for %s:\n%s' %
+                           (event, repr(handler), traceback.format_exc()))
+            self.unregister(handler)
+            handler.handle_error()
+
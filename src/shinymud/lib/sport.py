@@ -1,4 +1,5 @@
 from shinymud.lib.world import World
+from shinymud.lib.tasks import run_all
 from shinymud.data.config import AREAS_IMPORT_DIR, AREAS_EXPORT_DIR
 from shinymud.lib.sport_plugins import SportError
 
@@ -21,14 +22,22 @@ def inport(obj_type, obj_name, format=None, transport=None, source_path=AREAS_IM
     transport - the transport that should be used to retrieve the data
     source_path - extra information for locating an import object
     """
+    return run_all(inport_steps(obj_type, obj_name, format, transport, source_path))
+
+def inport_steps(obj_type, obj_name, format=None, transport=None, source_path=AREAS_IMPORT_DIR):
+    """The same as inport, but as the steps of a task (see TaskScheduler):
+    the data is retrieved in one step, and decoded in the next.
+    """
     format = format or DEFAULT_FORMAT
     transport = transport or DEFAULT_TRANSPORT
     world = World.get_world()
     
     if not hasattr(world, '%s_exists' % obj_type):
-        return 'Invalid type "%s". See "help export".' % obj_type
+        yield 'Invalid type "%s". See "help export".' % obj_type
+        return
     if getattr(world, '%s_exists' % obj_type)(obj_name):
-        return '%s "%s" already exists in your game.' % (obj_type.capitalize(), obj_name)
+        yield '%s "%s" already exists in your game.' % (obj_type.capitalize(), obj_name)
+        return
     
     try:
         #Find format
@@ -38,10 +47,16 @@ def inport(obj_type, obj_name, format=None, transport=None, source_path=AREAS_IM
         # all source-transports take world, the name of the target, and the source path
         # all read-formaters take the world and shiny_data
         fname = obj_name + '_' + obj_type + '.' + format
-        message = formatter(world, source(world, fname, source_path))
+        shiny_data = source(world, fname, source_path)
+    except SportError as e:
+        yield str(e)
+        return
+    yield
+    try:
+        message = formatter(world, shiny_data)
     except SportError as e:
         message = str(e)
-    return message
+    yield message
 
 def export(obj_type, shiny_obj, format=None, transport=None, dest_path=AREAS_EXPORT_DIR):
     """Export an object from the MUD to an outside source.
@@ -52,6 +67,12 @@ def export(obj_type, shiny_obj, format=None, transport=None, dest_path=AREAS_EXP
     transport - the transport that should be used to save the data
     dest_path - extra information for sending/saving the object
     """
+    return run_all(export_steps(obj_type, shiny_obj, format, transport, dest_path))
+
+def export_steps(obj_type, shiny_obj, format=None, transport=None, dest_path=AREAS_EXPORT_DIR):
+    """The same as export, but as the steps of a task (see TaskScheduler):
+    the object is encoded in one step, and sent off in the next.
+    """
     format = format or DEFAULT_FORMAT
     transport = transport or DEFAULT_TRANSPORT
     world = World.get_world()
@@ -62,10 +83,16 @@ def export(obj_type, shiny_obj, format=None, transport=None, dest_path=AREAS_EXP
         # all destination transports take world, shiny_data, filename, and destination_path
         # all write-formatters take a shiny object.
         fname = shiny_obj.name + '_' + obj_type + '.' + format
-        message = dest(world, formatter(shiny_obj), fname, dest_path)
+        shiny_data = formatter(shiny_obj)
+    except SportError as e:
+        yield str(e)
+        return
+    yield
+    try:
+        message = dest(world, shiny_data, fname, dest_path)
     except SportError as e:
         message = str(e)
-    return message
+    yield message
 
 def inport_dir(obj_type, format=None, source_path=AREAS_IMPORT_DIR):
     """Import a batch of area files from a directory.
@@ -73,7 +100,12 @@ def inport_dir(obj_type, format=None, source_path=AREAS_IMPORT_DIR):
     or the string 'all'. If the string 'all' is given, import_list will
     attempt to import all areas in the default import directory.
     """
-    world = World.get_world()
+    return run_all(inport_dir_steps(obj_type, format, source_path))
+
+def inport_dir_steps(obj_type, format=None, source_path=AREAS_IMPORT_DIR):
+    """The same as inport_dir, but as the steps of a task (see
+    TaskScheduler), with the result of each import reported as it's done.
+    """
     import_list = []
     for filename in os.listdir(source_path):
         match = NAME_REG.match(filename)
@@ -87,21 +119,18 @@ def inport_dir(obj_type, format=None, source_path=AREAS_IMPORT_DIR):
                 elif not format:
                     import_list.append({'name': fname, 'format': fformat})
     if not import_list:
-        return "I couldn't find any %ss in %s." % (obj_type, source_path)
+        yield "I couldn't find any %ss in %s." % (obj_type, source_path)
+        return
     
-    results = ''
     for thing in import_list:
-        results += 'Importing %s %s... ' % (obj_type, thing['name'])
-        try:
-            status = inport(obj_type, thing['name'], thing['format'], 'file', 
-                            source_path)
-        except SportError as e:
-            results += 'Failed: ' + str(e) + '\n'
-        else:
-            results += status + '\n'
-    if not results:
-        return 'No areas were found in %s.\n' % source_path
-    return results
+        status = ''
+        for message in inport_steps(obj_type, thing['name'], thing['format'],
+                                    'file', source_path):
+            if message:
+                status += message
+            else:
+                yield
+        yield 'Importing %s %s... %s\n' % (obj_type, thing['name'], status)
 
 def list_importable(obj_type, format=None, transport=None, source_path=None):
     """ List the objects that are available for import.
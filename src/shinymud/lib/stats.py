@@ -0,0 +1,36 @@
+from collections import deque
+
+class RollingSample(object):
+    """Keeps the most recent size measurements in a fixed-size ring buffer,
+    and reports percentiles over them.
+    """
+    def __init__(self, size=1000):
+        self.samples = deque(maxlen=size)
+
+    def add(self, value):
+        self.samples.append(value)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def percentile(self, p):
+        """Return the p-th percentile (0-100) of the current samples, or
+        None if there aren't any.
+        """
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = int(round((p / 100.0) * (len(ordered) - 1)))
+        return ordered[index]
+
+    def max(self):
+        if not self.samples:
+            return None
+        return max(self.samples)
+
+
+def ms(seconds):
+    """Format a duration given in seconds as milliseconds for display."""
+    if seconds is None:
+        return '-'
+    return '%.1fms' % (seconds * 1000)
@@ -0,0 +1,124 @@
+import itertools
+import time
+import traceback
+
+def run_all(steps):
+    """Run a task's steps (see TaskScheduler) all at once, right now, and
+    return the messages it yielded along the way, joined together.
+    """
+    return ''.join([message for message in steps if message])
+
+
+class Task(object):
+    """A long-running job that the world does a step at a time. See
+    TaskScheduler.
+    """
+    def __init__(self, task_id, name, steps, owner=None):
+        self.id = task_id
+        self.name = name
+        self.steps = steps
+        self.owner = owner
+        self.started = time.time()
+        self.steps_run = 0
+        # How much time has actually been spent running our steps
+        self.runtime = 0
+        self.status = 'Waiting to start.'
+        self.done = False
+
+    def cancel(self):
+        """Stop this task before it's done. Its steps get a GeneratorExit at
+        the point where they last yielded, so they can clean up after
+        themselves.
+        """
+        if not self.done:
+            self.done = True
+            self.steps.close()
+            self.status = 'Cancelled.'
+            self.report('Task %s (%s) has been cancelled.\n' % (self.id, self.name))
+
+    def report(self, message):
+        """Tell whoever started this task how it's going."""
+        if self.owner and not getattr(self.owner, 'logged_out', False):
+            self.owner.update_output(message)
+
+
+class TaskScheduler(object):
+    """The world's long-running jobs (destroying or importing an area,
+    resetting a big area by hand, etc.), which are too big to do all at once
+    without holding up every player in the game.
+
+    A task's steps are given as a generator, which should yield after every
+    small unit of work. The world runs the steps of each task in turn, until
+    it has spent its budget for the turn, and picks up where it left off on
+    the next turn. Whenever the generator yields a message (rather than
+    None), it's passed on to the player who started the task, if any.
+    Anything that needs a job done right away can still use run_all() to run
+    all of its steps at once.
+    """
+    def __init__(self, log):
+        self.log = log
+        self.tasks = []
+        self.ids = itertools.count(1)
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def start(self, name, steps, owner=None):
+        """Start a new task, with name (for the task list), steps (a
+        generator) and the player that started it (owner). Returns the
+        Task.
+        """
+        task = Task(self.ids.next(), name, steps, owner)
+        self.tasks.append(task)
+        self.log.info('Task %s (%s) started by %s.' % (task.id, name,
+                                                     getattr(owner, 'name', 'the world')))
+        return task
+
+    def get(self, task_id):
+        for task in self.tasks:
+            if task.id == task_id:
+                return task
+        return None
+
+    def run(self, until):
+        """Run the steps of our tasks, a step from each in turn, until the
+        time until (in seconds since the epoch). At least one step gets run,
+        even if we're already running late. Returns the number of steps
+        that were run.
+        """
+        count = 0
+        while self.tasks:
+            for task in self.tasks:
+                self.step(task)
+                count += 1
+                if time.time() >= until:
+                    break
+            self.tasks = [task for task in self.tasks if not task.done]
+            if time.time() >= until:
+                break
+        return count
+
+    def step(self, task):
+        """Run the next step of task."""
+        if task.done:
+            return
+        start = time.time()
+        try:
+            message = task.steps.next()
+        except StopIteration:
+            task.done = True
+            task.status = 'Finished.'
+        except Exception:
+            task.done = True
+            task.status = 'Failed.'
+            self.log.error('Task %s (%s) failed:\n%s' % (task.id, task.name,
+                                                       traceback.format_exc()))
+            task.report('Task %s (%s) failed! Check the logfile for details.\n' %
+                        (task.id, task.name))
+        else:
+            task.steps_run += 1
+            if message:
+                task.status = message.strip()
+                task.report(message)
+        task.runtime += time.time() - start
+
@@ -0,0 +1,121 @@
+import heapq
+import itertools
+import time
+import traceback
+
+class Timer(object):
+    """A callback that has been scheduled on a TimerQueue. Keep hold of it if
+    you might want to cancel it.
+    """
+    def __init__(self, queue, when, callback, args, interval=None):
+        self.queue = queue
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.interval = interval
+        self.cancelled = False
+        self.pending = False
+
+    def cancel(self):
+        """Stop this timer from ever going off (again)."""
+        if not self.cancelled:
+            self.cancelled = True
+            if self.pending:
+                self.queue._cancelled()
+
+
+class TimerQueue(object):
+    """The world's timers, kept in a heap ordered by when they're due.
+
+    Anything that needs to happen at some later time (area resets, effects
+    wearing off, merchants restocking, etc.) should schedule a timer here
+    rather than checking the clock every turn -- run_due only ever looks at
+    the timers that are actually due, so a timer costs nothing until it goes
+    off.
+    """
+    def __init__(self, log):
+        self.log = log
+        self.heap = []
+        # Breaks ties between timers due at the same time, so they go off in
+        # the order they were scheduled (and we never compare callbacks)
+        self.counter = itertools.count()
+        self.cancelled = 0
+
+    def __len__(self):
+        return len(self.heap) - self.cancelled
+
+    def call_at(self, when, callback, *args):
+        """Call callback(*args) once the time is when."""
+        timer = Timer(self, when, callback, args)
+        self._push(timer)
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        """Call callback(*args) delay seconds from now."""
+        return self.call_at(time.time() + delay, callback, *args)
+
+    def call_every(self, interval, callback, *args):
+        """Call callback(*args) every interval seconds, starting interval
+        seconds from now, until the timer is cancelled.
+        """
+        timer = Timer(self, time.time() + interval, callback, args, interval)
+        self._push(timer)
+        return timer
+
+    def _cancelled(self):
+        """Called when one of our timers is cancelled. Cancelled timers are
+        left in the heap (removing them would mean re-heaping) until they come
+        due, unless they start to outnumber the live ones.
+        """
+        self.cancelled += 1
+        if self.cancelled > 64 and self.cancelled > len(self.heap) / 2:
+            self.heap = [entry for entry in self.heap if not entry[2].cancelled]
+            heapq.heapify(self.heap)
+            self.cancelled = 0
+
+    def next_due(self):
+        """Return when the next timer is due, or None if there aren't any."""
+        while self.heap and self.heap[0][2].cancelled:
+            heapq.heappop(self.heap)[2].pending = False
+            self.cancelled -= 1
+        if self.heap:
+            return self.heap[0][0]
+        return None
+
+    def run_due(self, now=None):
+        """Run every timer that's due. Returns the number of timers run.
+        Timers that get scheduled by the ones we run have to wait for the
+        next call, even if they're already due.
+        """
+        if now is None:
+            now = time.time()
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            when, count, timer = heapq.heappop(self.heap)
+            timer.pending = False
+            if timer.cancelled:
+                self.cancelled -= 1
+            else:
+                due.append(timer)
+        for timer in due:
+            if timer.cancelled:
+                # One of the timers before it cancelled it
+                continue
+            if timer.interval:
+                # Reschedule before running, so the callback can cancel it
+                timer.when += timer.interval
+                if timer.when <= now:
+                    # Don't try to make up for lost time
+                    timer.when = now + timer.interval
+                self._push(timer)
+            try:
+                timer.callback(*timer.args)
+            except Exception:
+                self.log.error('Timer %s failed:\n%s' % (repr(timer.callback),
+                                                        traceback.format_exc()))
+        return len(due)
+
+    def _push(self, timer):
+        timer.pending = True
+        heapq.heappush(self.heap, (timer.when, self.counter.next(), timer))
+
@@ -1,13 +1,25 @@
+from collections import deque, OrderedDict
 import threading
 import time
 import logging
 import logging.handlers
 
 from shinymud.lib.db import DB
+from shinymud.lib.reactor import Reactor
+from shinymud.lib.stats import RollingSample
+from shinymud.lib.admission import Admission
+from shinymud.lib.timers import TimerQueue
+from shinymud.lib.tasks import TaskScheduler, run_all
+from shinymud.lib.profiler import TurnProfiler
+from shinymud.lib.clock import TickClock, monotonic
 from shinymud.data.config import *
 
 class World(object):
     _instance = None
+    # The parts of the world that take a tick (see turn), in the order they
+    # take them in when they're due at the same time
+    SUBSYSTEMS = ['npcs', 'input', 'effects', 'battles', 'timers', 'resets',
+                  'tasks', 'output']
     @classmethod
     def __new__(cls, *args, **kwargs):
         if not cls._instance:
@@ -28,11 +40,38 @@ class World(object):
         self.shutdown_flag = False
         self.areas = {}
         self.db = DB(self.log, conn=conn)
+        self.reactor = Reactor(self.log)
+        self.timers = TimerQueue(self.log)
+        # Rooms waiting for their scheduled reset (see queue_reset)
+        self.reset_queue = deque()
+        self.reset_stats = {'rooms_reset': 0, 'max_pending': 0, 'max_wait': 0}
+        self.tasks = TaskScheduler(self.log)
+        self.input_latency = RollingSample()
+        self.profiler = TurnProfiler(TURN_HISTORY)
+        # Each subsystem keeps its own beat (see turn)
+        now = monotonic()
+        self.clocks = {}
+        for name in self.SUBSYSTEMS:
+            self.clocks[name] = TickClock(TICK_RATES.get(name, TICK_RATE), TICK_POLICY,
+                                          TICK_MAX_CATCHUP, now, TURN_HISTORY)
+        self.net_stats = {'bytes_queued': 0, 'bytes_dropped': 0, 'stalls': 0, 'rejected': 0}
+        self.admission = Admission(CONNECT_RATE, CONNECT_BURST, MAX_PRELOGIN)
+        # How many connections are still at the login prompt (see
+        # Player.login_finished)
+        self.prelogin_count = 0
         self.default_location = None
         self.currency_name = CURRENCY
         self.login_greeting = ''
         self.uptime = time.time()
-        self.active_npcs = []
+        # The npcs that have commands to run, in the order they'll get to run
+        # them (see npc_subscribe and tick_npcs)
+        self.active_npcs = OrderedDict()
+        # Players are only looked at when they have something to do: the
+        # players that need an input tick (see player_wake), the ones with
+        # output waiting to be sent, and the ones with effects running
+        self.awake_players = OrderedDict()
+        self.output_waiting = OrderedDict()
+        self.affected_players = OrderedDict()
         
         try:
             greet_file = open(ROOT_DIR + '/login_greeting.txt', 'r')
@@ -82,42 +121,160 @@ class World(object):
         self.battles_delete = []
     
     def start_turning(self):
+        """Run the world: every time one of its subsystems is due for a tick
+        (see SUBSYSTEMS), take a turn, and service the network in between.
+        """
         while not self.shutdown_flag:
-            start = time.time()
-            # Go through active npcs
-            for i in reversed(xrange(len(self.active_npcs))):
-                if not self.active_npcs[i].do_tick():
-                    del self.active_npcs[i]
-            # Manage player list
-            self.player_list_lock.acquire()
-            list_keys = self.player_list.keys()
-            for key in list_keys:
-                self.player_list[key].do_tick()
-            self.cleanup()
-            list_keys = self.player_list.keys()
-            for key in list_keys:
-                self.player_list[key].send_output()
-            self.player_list_lock.release()
-            
-            # Perform round actions for active battles
-            for key in self.battles.keys():
-                self.battles[key].perform_round()
-            
-            # Reset areas that have had activity
-            for area in self.areas.values():
-                if area.times_visited_since_reset > 0:
-                    now = time.time()
-                    if (now - area.time_of_last_reset) >= RESET_INTERVAL:
-                        area.reset()
-                        self.log.info('Area %s has been reset.' % area.name)
-            
-            finish = time.time() - start
-            if finish >= 1:
-                self.log.critical('WORLD: Turn took longer than a sec!')
-            elif finish < 0.25:
-                time.sleep(0.25 - finish)
+            self.turn()
+            # Instead of sleeping until the next tick, service the network
+            self.poll_network(self.next_tick())
         self.listening = False
     
+    def next_tick(self):
+        """Return when the next subsystem is due for a tick (on the world's
+        monotonic clock).
+        """
+        return min([clock.next_tick for clock in self.clocks.values()])
+    
+    def turn(self, now=None):
+        """Take a turn of the world: tick each of the subsystems whose tick is
+        due. Each subsystem keeps its own steady beat (see TICK_RATES), so
+        cheap work that needs doing often (reading input and sending output)
+        isn't held back by expensive work that doesn't (battles, resets).
+        """
+        if now is None:
+            now = monotonic()
+        profiler = self.profiler
+        profiler.start_turn()
+        for name in self.SUBSYSTEMS:
+            clock = self.clocks[name]
+            if clock.due(now):
+                runs, scale = clock.start_tick(now)
+                for i in xrange(runs):
+                    getattr(self, 'tick_' + name)(scale)
+                profiler.phase(name)
+            if name == 'input':
+                self.cleanup()
+                profiler.phase('cleanup')
+        finish = profiler.end_turn()
+        if finish >= 1:
+            phase, seconds = profiler.slowest_phase()
+            self.log.critical('WORLD: Turn took longer than a sec! (%s took %.2fs; see "lag")' %
+                              (phase, seconds))
+    
+    def tick_npcs(self, ticks=1):
+        """Give each of the npcs that have something to do a turn to run up
+        to NPC_COMMANDS_PER_TICK of their commands, spending no more than
+        NPC_BUDGET seconds on them (at least one npc always gets a turn).
+        Npcs that still have commands left go to the back of the line, so the
+        ones we didn't get to this tick go first on the next.
+        """
+        profiler = self.profiler
+        profiler.gauge('npc_queue', len(self.active_npcs))
+        until = time.time() + NPC_BUDGET
+        for key in self.active_npcs.keys():
+            npc = self.active_npcs.pop(key)
+            if npc.do_tick(NPC_COMMANDS_PER_TICK):
+                self.active_npcs[key] = npc
+            now = time.time()
+            profiler.charge('areas', npc.area.name, now - profiler.mark)
+            profiler.phase('npcs', now)
+            if now >= until:
+                break
+        profiler.gauge('npc_waiting', len(self.active_npcs))
+    
+    def tick_input(self, ticks=1):
+        """Read the input of each of the players that have been woken up (see
+        player_wake), and run their commands. Players that are idle aren't
+        looked at at all.
+        """
+        self.player_list_lock.acquire()
+        awake = self.awake_players
+        self.awake_players = OrderedDict()
+        for player in awake.values():
+            if player.do_tick():
+                self.player_wake(player)
+            # Whatever the player did, they'll get a prompt for it
+            self.output_waiting[id(player)] = player
+        self.player_list_lock.release()
+    
+    def tick_effects(self, ticks=1):
+        """Let the effects on each player (drunkenness, etc.) run their
+        course.
+        """
+        for key, player in self.affected_players.items():
+            if player.logged_out or not player.cycle_effects(ticks):
+                del self.affected_players[key]
+    
+    def tick_battles(self, ticks=1):
+        """Fight a round of each of the active battles."""
+        profiler = self.profiler
+        for key in self.battles.keys():
+            battle = self.battles[key]
+            battle.perform_round(ticks)
+            now = time.time()
+            profiler.charge('battles', str(battle), now - profiler.mark)
+            profiler.phase('battles', now)
+    
+    def tick_timers(self, ticks=1):
+        """Run anything that's scheduled to happen by now (area resets,
+        etc.)
+        """
+        self.timers.run_due()
+    
+    def tick_resets(self, ticks=1):
+        self.run_resets(time.time() + RESET_BUDGET)
+    
+    def tick_tasks(self, ticks=1):
+        """Work on any long-running jobs (see TaskScheduler)."""
+        self.tasks.run(time.time() + TASK_BUDGET)
+    
+    def tick_output(self, ticks=1):
+        """Send the output that has piled up for each of the players that have
+        any (see player_output).
+        """
+        self.player_list_lock.acquire()
+        waiting = self.output_waiting
+        self.output_waiting = OrderedDict()
+        for player in waiting.values():
+            player.send_output()
+            if player.backlog is not None and not player.logged_out:
+                # Keep checking on them until their client catches up
+                self.player_output(player)
+        self.player_list_lock.release()
+    
+    def poll_network(self, until):
+        """Let the reactor accept new connections and read from the sockets
+        that have data waiting, until the time until (on the world's
+        monotonic clock; see lib/clock.py). The network is always polled at
+        least once, even if we're already running late.
+        """
+        while True:
+            timeout = until - monotonic()
+            self.reactor.poll(max(timeout, 0))
+            self.dispatch_input()
+            if timeout <= 0:
+                break
+    
+    def dispatch_input(self):
+        """In immediate INPUT_DISPATCH mode, run the commands of every player
+        whose input has just arrived and send them the results right away,
+        instead of making them wait for the next turn. In turn mode (or if
+        there's more for them to do) they're woken up, and their input is
+        picked up by their next do_tick.
+        """
+        ready = self.reactor.pop_ready()
+        for conn in ready:
+            player = conn.player
+            if not player or player.logged_out:
+                continue
+            if INPUT_DISPATCH == 'immediate':
+                awake = player.do_tick()
+                player.send_output()
+                if not awake:
+                    continue
+            self.player_wake(player)
+    
     def has_location(self, area_name, room_id):
         """Check if a location (room) exists given an area name and a room id.
         Returns True if the room exists, false if it doesn't.
@@ -142,6 +299,41 @@ class World(object):
 # Here exist all the functions that the world uses to manage the areas
 # it contains.
     
+    def queue_reset(self, area):
+        """Queue up a scheduled reset of all of an area's rooms. The rooms
+        are reset a few at a time by run_resets, so that a big area (or a lot
+        of areas at once) can't hold up a whole turn.
+        """
+        now = time.time()
+        for room in area.rooms.values():
+            self.reset_queue.append((room, now))
+            area.resets_pending += 1
+        pending = len(self.reset_queue)
+        if pending > self.reset_stats['max_pending']:
+            self.reset_stats['max_pending'] = pending
+    
+    def run_resets(self, until):
+        """Reset the rooms waiting in the reset queue until the time until
+        (in seconds since the epoch). At least one room gets reset, even if
+        we're already running late.
+        """
+        while self.reset_queue:
+            room, queued = self.reset_queue.popleft()
+            area = room.area
+            area.resets_pending -= 1
+            if self.areas.get(area.name) is area and str(room.id) in area.rooms:
+                # (Rooms and areas may have been destroyed since they were
+                # queued)
+                started = time.time()
+                room.reset()
+                self.profiler.charge('areas', area.name, time.time() - started)
+                self.reset_stats['rooms_reset'] += 1
+            now = time.time()
+            if now - queued > self.reset_stats['max_wait']:
+                self.reset_stats['max_wait'] = now - queued
+            if now >= until:
+                break
+    
     def area_add(self, area):
         self.areas[area.name] = area
     
@@ -167,13 +359,21 @@ class World(object):
         return None
     
     def destroy_area(self, area_name, playername):
-        """Destroy an entire area! TODO: whoa nelly, they want to destroy a
+        """Destroy an entire area, all at once. Returns a message saying how it
+        went. (See destroy_area_steps, to do it a bit at a time instead.)
+        """
+        return run_all(self.destroy_area_steps(area_name, playername))
+    
+    def destroy_area_steps(self, area_name, playername):
+        """Destroy an entire area, one object at a time, as the steps of a
+        task (see TaskScheduler). TODO: whoa nelly, they want to destroy a
         whole area! We should really make sure that's what they want by adding
         an extra game state that blocks all actions until they confirm. """
         self.log.warning('%s is attempting to destroy area %s.' % (playername, area_name))
         area = self.get_area(area_name)
         if not area:
-            return 'Area %s doesn\'t exist.\n' % area_name
+            yield 'Area %s doesn\'t exist.\n' % area_name
+            return
         if self.default_location and self.default_location.area == area:
             self.default_location = None
         for player in self.player_list.values():
@@ -195,25 +395,40 @@ class World(object):
                     if playername != player.name:
                         player.update_output('The area you were working on was just nuked by %s.\n' %
                                                                             playername.capitalize())
-        item_keys = area.items.keys()
-        for item in item_keys:
-            self.log.debug(area.destroy_item(item))
-        script_keys = area.scripts.keys()
-        for script in script_keys:
-            self.log.debug(area.destroy_script(script))
-        npc_keys = area.npcs.keys()
-        for npc in npc_keys:
-            self.log.debug(area.destroy_npc(npc))
-        room_keys = area.rooms.keys()
-        self.log.debug('About to destroy the rooms.')
-        for room in room_keys:
-            self.log.debug(area.destroy_room(room))
-        self.log.debug('Should have destroyed the rooms')
-        area.destruct()
+        if area.reset_timer:
+            area.reset_timer.cancel()
+            area.reset_timer = None
+        # Take the area out of the world while we take it apart, so nobody
+        # wanders into it (or resets it) in the meantime
         del self.areas[area.name]
+        try:
+            item_keys = area.items.keys()
+            for item in item_keys:
+                self.log.debug(area.destroy_item(item))
+                yield
+            script_keys = area.scripts.keys()
+            for script in script_keys:
+                self.log.debug(area.destroy_script(script))
+                yield
+            npc_keys = area.npcs.keys()
+            for npc in npc_keys:
+                self.log.debug(area.destroy_npc(npc))
+                yield
+            room_keys = area.rooms.keys()
+            self.log.debug('About to destroy the rooms.')
+            for room in room_keys:
+                self.log.debug(area.destroy_room(room))
+                yield
+            self.log.debug('Should have destroyed the rooms')
+        except GeneratorExit:
+            # We've been cancelled; put back what's left
+            self.area_add(area)
+            self.log.info('%s stopped destroying area %s.' % (playername, area_name))
+            raise
+        area.destruct()
         area.name = None
         self.log.info('%s destroyed area %s.' % (playername, area_name))
-        return 'Area %s was successfully destroyed. I hope you meant to do that.\n' % area_name
+        yield 'Area %s was successfully destroyed. I hope you meant to do that.\n' % area_name
     
 # ************************ Player Functions ************************
 # Here exist all the functions that the world uses to manage the players
@@ -229,7 +444,7 @@ class World(object):
             elif player.mode and player.mode.name != 'BuildMode':
                 pass
             else:
-                player.update_output(message)
+                player.update_output(message, critical=False)
     
     def has_player(self, name):
         """Return true if the world has this player's name in its player list."""
@@ -255,6 +470,26 @@ class World(object):
         if isinstance(key, basestring):
             key = key.lower()
         self.player_list[key] = player
+        self.player_wake(player)
+        interval = getattr(player.conn, 'KEEPALIVE_INTERVAL', None)
+        if interval and not player.keepalive_timer:
+            player.keepalive_timer = self.timers.call_every(interval, player.conn.keepalive)
+    
+    def player_wake(self, player):
+        """Give player an input tick on the next turn (because their input
+        has arrived, say, or their mode has work to do without it).
+        """
+        self.awake_players[id(player)] = player
+    
+    def player_output(self, player):
+        """Note that player has output waiting to be sent."""
+        self.output_waiting[id(player)] = player
+    
+    def player_affected(self, player):
+        """Note that player has effects that need to run their course (see
+        tick_effects).
+        """
+        self.affected_players[id(player)] = player
     
     def player_remove(self, playername):
         """Add a player's name to the world's delete list so they get removed
@@ -281,6 +516,9 @@ class World(object):
 # ********************** NPC Functions **********************
 # Here exist all the function that the world uses to manage active npcs
     def npc_subscribe(self, npc):
-        """Add an npc to the world's active_npcs list."""
-        self.active_npcs.append(npc)
+        """Add an npc to the world's active_npcs, if it isn't there already,
+        so that it gets to run the commands in its cmdq.
+        """
+        if id(npc) not in self.active_npcs:
+            self.active_npcs[id(npc)] = npc
     
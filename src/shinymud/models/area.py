@@ -6,6 +6,8 @@ from shinymud.models.npc import Npc
 from shinymud.models.script import Script
 from shinymud.modes.text_edit_mode import TextEditMode
 from shinymud.lib.world import World
+from shinymud.data.config import RESET_INTERVAL, RESET_JITTER
+import random
 import time
 
 class Area(Model):
@@ -27,6 +29,9 @@ class Area(Model):
         self.scripts = {}
         self.time_of_last_reset = 0
         self.times_visited_since_reset = 0
+        self.reset_timer = None
+        # How many of our rooms are waiting in the world's reset queue
+        self.resets_pending = 0
     
     def load(self):
         """Load all of this area's objects from the database."""
@@ -95,6 +100,50 @@ Description: \n    %s""" % (self.name,
             room.reset()
         self.time_of_last_reset = time.time()
     
+    def reset_steps(self):
+        """Reset this area a room at a time, as the steps of a task (see
+        TaskScheduler).
+        """
+        for room in self.rooms.values():
+            if room.id is not None:
+                # (Unless it's been destroyed in the meantime)
+                room.reset()
+            yield
+        self.time_of_last_reset = time.time()
+    
+    def visited(self):
+        """Note that a player has entered one of this area's rooms. The first
+        visit since the last reset schedules the next one.
+        """
+        self.times_visited_since_reset += 1
+        if not self.reset_timer:
+            when = max(time.time(), self.time_of_last_reset + RESET_INTERVAL)
+            when += random.uniform(0, RESET_JITTER)
+            self.reset_timer = self.world.timers.call_at(when, self.scheduled_reset)
+    
+    def scheduled_reset(self):
+        """Queue up this area's rooms to be reset when its reset timer goes
+        off (see World.queue_reset).
+        """
+        self.reset_timer = None
+        if time.time() - self.time_of_last_reset < RESET_INTERVAL:
+            # Someone has reset us by hand since the timer was set; wait a
+            # full interval from then instead
+            self.times_visited_since_reset = 0
+            self.visited()
+            return
+        if not self.resets_pending:
+            # (If we're still waiting on the last reset, don't pile on)
+            self.world.queue_reset(self)
+        self.time_of_last_reset = time.time()
+        self.world.log.info('Area %s is being reset.' % self.name)
+        self.times_visited_since_reset = 0
+        # If there are still players around, they count as visitors
+        for room in self.rooms.values():
+            if room.players:
+                self.visited()
+                break
+    
 # ***** BuildMode Accessor Functions *****
     @classmethod
     def create(cls, area_dict={}):
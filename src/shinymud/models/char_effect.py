@@ -39,9 +39,9 @@ EFFECTS = CommandRegister()
 class Drunk(CharacterEffect):
     """A drunkeness effect."""
     name = 'drunk'
-    def execute(self):
+    def execute(self, ticks=1):
         if self.duration > 0:
-            self.duration -= 1
+            self.duration = max(0, self.duration - ticks)
         # We also aught to do some drunken things randomly, like the following:
         # randomly hiccup if drunk level is above 3
         # vomit and pass out if drunk level is above 5
@@ -177,9 +177,9 @@ class Character(Model):
         self.world.log.debug("%s hit for %s damage" % (self.fancy_name(), str(total)))
         self.hp -= total
         if attacker:
-            self.update_output("%s hit you for %s damage." % (attacker, str(total)))
+            self.update_output("%s hit you for %s damage." % (attacker, str(total)), critical=False)
         else:
-            self.update_output("You were hit for %s damage." % str(total))
+            self.update_output("You were hit for %s damage." % str(total), critical=False)
         if self.hp <= 0:
             self.battle.remove_character(self)
             self.battle = None
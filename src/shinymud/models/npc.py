@@ -7,6 +7,7 @@ from shinymud.commands import get_permission_names, PERMS
 from shinymud.commands.commands import command_list
 from shinymud.models.npc_event import NPCEvent
 from shinymud.models.npc_ai_packs import NPC_AI_PACKS
+from shinymud.data.config import NPC_CMDQ_LIMIT
 
 import re
 
@@ -105,7 +106,7 @@ description:
         """Return a capitalized version of the character's name."""
         return self.name
     
-    def update_output(self, message):
+    def update_output(self, message, critical=True):
         """Append any updates to this npc's action queue.
         Only log up to LOG_LINES worth of updates - once the limit is
         hit, delete the oldest messages to stay within the limit."""
@@ -113,12 +114,15 @@ description:
         if len(self.actionq) > self.LOG_LINES:
             del self.actionq[0]
     
-    def do_tick(self):
-        """Cycle through this npc's commands, if it has any."""
-        if not self.cmdq:
-            return False
-        self.cmdq.pop(0).run()
-        return True
+    def do_tick(self, count=1):
+        """Run up to count of this npc's queued commands. Returns True if it
+        still has commands left to run.
+        """
+        for i in xrange(count):
+            if not self.cmdq:
+                break
+            self.cmdq.pop(0).run()
+        return bool(self.cmdq)
     
 # ***** BuildMode accessor functions *****
     def build_set_description(self, description, player=None):
@@ -209,6 +213,11 @@ description:
             cmd_name, _, args = match.groups()
             cmd = command_list[cmd_name]
             if cmd:
+                if len(self.cmdq) >= NPC_CMDQ_LIMIT:
+                    # We're hearing more than we can ever get around to;
+                    # forget the newest commands rather than fall further behind
+                    self.world.profiler.count('npc_drops')
+                    return
                 self.cmdq.append(cmd(self, args, cmd_name))
                 self.world.npc_subscribe(self)
     
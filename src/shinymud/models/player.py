@@ -10,8 +10,10 @@ from shinymud.models import Model, Column, model_list
 from shinymud.models.shiny_types import *
 from shinymud.models.item import GameItem
 from shinymud.models.character import Character
+from shinymud.lib.connection_handlers.shiny_connections import OutputBacklog
 
 import re
+import time
 from socket import error as socket_error
 
 
@@ -37,7 +39,16 @@ class Player(Character):
         self.name = self.conn
         self.inq = []
         self.outq = []
+        self.backlog = None
+        self.stalled_since = None
+        self.show_prompt = True
+        # The last state we published to the client's out-of-band channel
+        self.oob_state = {}
         self.quit_flag = False
+        self.logged_out = False
+        # Whether we're counted in the world's prelogin_count
+        self.logging_in = False
+        self.keepalive_timer = None
         self.mode = InitMode(self)
         self.last_mode = None
         self.dbid = None
@@ -67,13 +78,23 @@ class Player(Character):
                     item.item_types['container'].load_inventory()
                 self.inventory.append(item)
     
-    def update_output(self, data):
-        """Helpfully inserts data into the player's output queue."""
+    def update_output(self, data, critical=True):
+        """Helpfully inserts data into the player's output queue.
+        If the player's connection has stalled, the data is held in their
+        backlog instead, where non-critical data (room chatter, battle spam,
+        etc.) may be dropped to keep it under OUTPUT_HIGH_WATER.
+        """
         if isinstance(data, basestring):
-            self.outq.append(data)
-        
-        elif isinstance(data, list):
+            data = [data]
+        elif not isinstance(data, list):
+            return
+        self.world.player_output(self)
+        if self.backlog is None:
             self.outq += data
+        else:
+            for line in data:
+                dropped = self.backlog.add(line, critical)
+                self.world.net_stats['bytes_dropped'] += dropped
     
     def get_input(self):
         """Gets raw input from the player and queues it for later processing."""
@@ -90,14 +111,113 @@ class Player(Character):
     
     def send_output(self):
         """Sends all data from the player's output queue to the player."""
+        if self.logged_out:
+            return
+        if self.backlog is not None and not self.check_backlog():
+            return
+        published = self.publish_state()
         if (len(self.outq) > 0):
             self.enqueue_prompt()
+            outbuf = getattr(self.conn, 'outbuf', None)
+            queued = outbuf.queued if outbuf is not None else 0
             alive = self.conn.send(self.outq)
+            if outbuf is not None:
+                self.world.net_stats['bytes_queued'] += outbuf.queued - queued
+                if alive and len(outbuf) > OUTPUT_HIGH_WATER and self.backlog is None:
+                    # The client isn't keeping up with us; hold on to their
+                    # output until they catch up
+                    self.backlog = OutputBacklog(OUTPUT_POLICY, OUTPUT_HIGH_WATER,
+                                                 OUTPUT_BACKLOG_CEILING)
+                    self.stalled_since = time.time()
+                    self.world.net_stats['stalls'] += 1
+                    self.world.log.info('%s has stalled with %s bytes unsent.' %
+                                        (self.name, len(outbuf)))
         
             if not alive:
                 # Sending failed - the connection is no longer alive. We should log
                 # the player out
                 self.player_logout(True)
+            elif getattr(self.conn, 'input_time', None):
+                # Our reply to the player's input is on its way; remember how
+                # long they had to wait for it
+                self.world.input_latency.add(time.time() - self.conn.input_time)
+                self.conn.input_time = None
+        elif published:
+            self.conn.flush()
+        if not self.inq and getattr(self.conn, 'input_time', None):
+            # The player's input didn't produce any output to time
+            self.conn.input_time = None
+    
+    def publish_state(self):
+        """Publish whatever has changed about the player's vitals, location
+        and inventory since last time to the client's out-of-band channel
+        (GMCP or websocket JSON), if it's listening. Returns True if anything
+        was published.
+        """
+        conn = self.conn
+        if not (self.dbid and getattr(conn, 'oob_enabled', False)):
+            return False
+        published = False
+        last = self.oob_state
+        if conn.oob_wanted('Char.Vitals'):
+            vitals = {'hp': self.hp, 'maxhp': self.max_hp, 'mp': self.mp, 'maxmp': self.max_mp}
+            old = last.get('vitals', {})
+            changes = dict([(k, v) for k, v in vitals.items() if old.get(k) != v])
+            if changes:
+                conn.send_oob('Char.Vitals', changes)
+                last['vitals'] = vitals
+                published = True
+        if conn.oob_wanted('Room.Info') and self.location:
+            room = self.location
+            exits = dict([(direction, '%s.%s' % (exit.to_area, exit.to_room_id))
+                          for direction, exit in room.exits.items() if exit])
+            info = {'num': room.id, 'area': room.area.name, 'name': room.name, 'exits': exits}
+            if info != last.get('room'):
+                conn.send_oob('Room.Info', info)
+                last['room'] = info
+                published = True
+        if conn.oob_wanted('Char.Items'):
+            items = dict([(str(item.dbid or id(item)), item.name) for item in self.inventory])
+            old = last.get('items')
+            if old is None:
+                conn.send_oob('Char.Items.List', {'location': 'inv', 'items':
+                              [{'id': key, 'name': name} for key, name in items.items()]})
+                published = True
+            elif items != old:
+                for key, name in items.items():
+                    if key not in old:
+                        conn.send_oob('Char.Items.Add', {'location': 'inv',
+                                                         'item': {'id': key, 'name': name}})
+                for key, name in old.items():
+                    if key not in items:
+                        conn.send_oob('Char.Items.Remove', {'location': 'inv',
+                                                            'item': {'id': key, 'name': name}})
+                published = True
+            last['items'] = items
+        return published
+    
+    def check_backlog(self):
+        """Check on a stalled connection. If the client has drained its
+        output buffer far enough, release the backlog; if it has been
+        stalled for too long (and our policy is 'disconnect'), disconnect it.
+        Under 'disconnect', a player whose backlog has hit its ceiling is
+        disconnected right away. Returns False if the player has been logged
+        out.
+        """
+        if self.conn.closed:
+            self.player_logout(True)
+            return False
+        if len(self.conn.outbuf) <= OUTPUT_HIGH_WATER / 2:
+            self.outq = self.backlog.lines() + self.outq
+            self.backlog = None
+            self.stalled_since = None
+        elif OUTPUT_POLICY == 'disconnect' and (self.backlog.overflowed or
+             (time.time() - self.stalled_since) > OUTPUT_STALL_TIMEOUT):
+            self.world.log.info('%s has been stalled for too long; disconnecting.' %
+                                self.name)
+            self.player_logout(True)
+            return False
+        return True
     
     def enqueue_prompt(self):
         """Get a prompt for the player."""
@@ -107,7 +227,8 @@ class Player(Character):
             default = '> '
             
         if not self.mode:
-            self.outq.append(default)
+            if self.show_prompt:
+                self.outq.append(default)
         
         elif self.mode.name == 'BuildMode':
             prompt = '<Build'
@@ -141,29 +262,55 @@ class Player(Character):
                     self.update_output("I don't understand \"%s\"\n" % raw_string)
     
     def do_tick(self):
-        """What should happen to the player everytime the world ticks."""
+        """What should happen to the player when the world gives them an input
+        tick (see World.player_wake). Returns True if the player needs another
+        one: they still have input waiting, or their mode has moved on and may
+        have work to do without any. (Their effects are run separately; see
+        cycle_effects.)
+        """
+        if self.logged_out:
+            # We've already let them go (their connection broke earlier this
+            # turn); they'll be off the player list by the next one
+            return False
         if self.quit_flag:
             self.player_logout()
+            return False
+        mode = self.mode
+        state = getattr(mode, 'state', None)
+        self.process_input()
+        return bool(self.inq) or self.quit_flag or self.mode is not mode or \
+               getattr(self.mode, 'state', None) != state
+    
+    def process_input(self):
+        """Get any new input from the player, and hand it to the player's
+        current mode (or run it as commands, if they aren't in a mode).
+        """
+        self.get_input()
+        if not self.mode:
+            self.parse_command()
+        elif self.mode.active:
+            self.mode.state()
+            if not self.mode.active:
+                if self.last_mode:
+                    self.mode = self.last_mode
+                else:
+                    self.mode = None
         else:
-            if self.dbid:
-                self.cycle_effects()
-            self.get_input()
-            if not self.mode:
-                self.parse_command()
-            elif self.mode.active:
-                self.mode.state()
-                if not self.mode.active:
-                    if self.last_mode:
-                        self.mode = self.last_mode
-                    else:
-                        self.mode = None
-            else:
-                # If we get here somehow (where the state of this mode is not
-                # active, but the mode has not been cleared), just clear the
-                # mode.
-                self.mode = None
+            # If we get here somehow (where the state of this mode is not
+            # active, but the mode has not been cleared), just clear the
+            # mode.
+            self.mode = None
     
     def player_logout(self, broken_pipe=False):
+        # A broken connection can be noticed more than once before the player
+        # is taken off the player list (when sending, and again when reading);
+        # only log them out the first time.
+        if self.logged_out:
+            return
+        self.logged_out = True
+        self.login_finished()
+        if self.keepalive_timer:
+            self.keepalive_timer.cancel()
         # If this player doesn't have a dbid, that means this player got
         # disconnected before they made it through the character creation
         # process. Don't save the incomplete data.
@@ -185,6 +332,14 @@ class Player(Character):
             self.world.player_remove(self.name)
             self.world.log.debug("Logging out an unnamed player.")
     
+    def login_finished(self):
+        """Stop counting this player as one that's logging in, once they've
+        made it into the world (or left without making it).
+        """
+        if self.logging_in:
+            self.logging_in = False
+            self.world.prelogin_count -= 1
+    
     def set_mode(self, mode):
         if mode == 'build':
             self.mode = BuildMode(self)
@@ -290,13 +445,17 @@ class Player(Character):
         look = """%s\n%s\n%s\n%s%s%s""" % (title, xits, desc, items, npcs, players)
         return look
     
-    def cycle_effects(self):
+    def cycle_effects(self, ticks=1):
+        """Run each of the player's effects for ticks ticks, and end the ones
+        that have run out. Returns True if the player has any effects left.
+        """
         for name in self.effects.keys():
             if self.effects[name].duration > 0:
-                self.effects[name].execute()
+                self.effects[name].execute(ticks)
             else:
                 self.effects[name].end()
                 del self.effects[name]
+        return bool(self.effects)
     
     def effects_add(self, effect_list):
         """Add a list of character effects to the player."""
@@ -311,6 +470,8 @@ class Player(Character):
                 self.world.log.debug(effect.duration)
             
             self.effects[effect.name].begin()
+        if self.effects:
+            self.world.player_affected(self)
     
     def effect_remove(self, effect):
         """Remove an effect from this player."""
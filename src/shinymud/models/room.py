@@ -375,7 +375,7 @@ spawns: %s""" % (self.name, self.description, nice_exits, spawns)
             self.npcs.append(char)
         else:
             self.players[char.name] = char
-            self.area.times_visited_since_reset += 1
+            self.area.visited()
             self.fire_event('pc_enter', {'player': char, 'from': prev_room})
     
     def remove_char(self, char):
@@ -411,7 +411,7 @@ spawns: %s""" % (self.name, self.description, nice_exits, spawns)
         """Echo something to everyone in the room, except the people on the exclude list."""
         for person in self.players.values():
             if (person.name not in exclude_list) and (person.position[0] != 'sleeping'):
-                person.update_output(message)
+                person.update_output(message, critical=False)
         self.fire_event('hears', {'string': message, 'teller': teller})
     
 #************** Item Management **************
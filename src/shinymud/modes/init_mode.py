@@ -1,11 +1,12 @@
 from shinymud.commands.commands import *
-from shinymud.data.config import GAME_NAME, EMAIL_ENABLED
+from shinymud.data.config import GAME_NAME, EMAIL_ENABLED, LOGIN_TIMEOUT
 from shinymud.lib.ansi_codes import CONCEAL, CLEAR, COLOR_FG_RED
 from shinymud.lib.world import World
 from shinymud.lib.shinymail import *
 
 import random
 import hashlib
+import time
 import re
 
 BAD_PASSWORDS = ['cancel', '@cancel', 'password', 'passwd', 'forgot']
@@ -54,6 +55,7 @@ class InitMode(object):
         self.world = World.get_world()
         self.log = self.world.log
         self.save = {}
+        self.last_input = time.time()
         
     
     def get_input(self):
@@ -62,13 +64,19 @@ class InitMode(object):
         This function waits until there is player input (we are not guaranteed to
         get player-input on each world turn), then cleans up any newlines or
         whitespace and sends it to the next state-function stored in
-        self.next_state.
+        self.next_state. If the player goes LOGIN_TIMEOUT seconds without
+        sending any, they get logged out.
         """
         if len(self.player.inq) > 0:
             # We've got something to work with!
             arg = self.player.inq[0].strip().replace('\r', '').replace('\n', '')
             del self.player.inq[0]
             self.next_state(arg)
+            self.last_input = time.time()
+        elif time.time() - self.last_input > LOGIN_TIMEOUT:
+            # Don't let idle connections hang around at the login prompt
+            self.player.update_output('You took too long to log in. Goodbye!')
+            self.player.quit_flag = True
     
     def intro(self):
         """Output the intro Message.
@@ -215,6 +223,7 @@ class InitMode(object):
         entered the world!
         """
         self.active = False
+        self.player.login_finished()
         self.player.update_output(['', 'You have entered the world of %s.' % GAME_NAME, ''])
         if self.newbie:
             nl = '*' + (' ' * 67) + '*'
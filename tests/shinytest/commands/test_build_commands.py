@@ -18,6 +18,11 @@ class TestBuildCommands(ShinyTestCase):
         self.bob.mode = BuildMode(self.bob)
         self.bob.permissions = self.bob.permissions | config.BUILDER
     
+    def run_tasks(self):
+        """Finish whatever tasks the last command started."""
+        import time
+        self.world.tasks.run(time.time() + 10)
+    
     def _clean_test_file(self, path):
         try:
             os.remove(path)
@@ -142,23 +147,27 @@ class TestBuildCommands(ShinyTestCase):
         
         # Make sure we fail if the area doesn't actually exist
         Export(self.bob, 'area bar', 'export').run()
+        self.run_tasks()
         self.world.log.debug(self.bob.outq)
         self.assertTrue('Area "bar" doesn\'t exist.' in self.bob.outq)
         
         # We should fail if the player gives us incorrect syntax
         error = 'Try: "export <area/player> <name>", or see "help export".'
         Export(self.bob, 'lol', 'export').run()
+        self.run_tasks()
         self.assertTrue(error in self.bob.outq)
         
         # Character exporting doesn't exist yet, but make sure the player gets
         # the correct logic branch if they try it
         error = 'Invalid type "char". See "help export".'
         Export(self.bob, 'char bob', 'export').run()
+        self.run_tasks()
         self.assertTrue(error in self.bob.outq)
         
         # Make sure exporting actually works
         self.assertTrue(self.world.area_exists('superlongtestfoo'))
         Export(self.bob, 'area superlongtestfoo', 'export').run()
+        self.run_tasks()
         self.world.log.debug(self.bob.outq)
         self.assertTrue(self.bob.outq[-1].startswith('Export complete!'))
         # make sure the file got created
@@ -173,27 +182,32 @@ class TestBuildCommands(ShinyTestCase):
         Area.create({'name': 'superlongtestbar', 'description': 'superlongtestbar is cool.'})
         Area.create({'name': 'superlongtestexistenz'})
         Export(self.bob, 'area superlongtestbar', 'import').run()
+        self.run_tasks()
         self.assertTrue(os.path.exists(AREAS_EXPORT_DIR + '/superlongtestbar_area.shiny_format'))
         self.world.destroy_area('superlongtestbar', 'test')
         self.assertFalse(self.world.area_exists('superlongtestbar'))
         
         # Make sure we fail if the area file doesn't actually exist
         Import(self.bob, 'area superlongtestfoo', 'import').run()
+        self.run_tasks()
         self.world.log.debug(self.bob.outq)
         self.assertTrue('Error: file superlongtestfoo_area.shiny_format does not exist.' in self.bob.outq)
         
         # Make sure we fail if the player gives incorrect syntax
         Import(self.bob, 'superlongtestbar', 'import').run()
+        self.run_tasks()
         error = 'Invalid type "superlongtestbar". See "help export".'
         self.assertTrue(error in self.bob.outq)
         
         # Make sure we fail if the area already exists in the MUD
         Import(self.bob, 'area superlongtestexistenz', 'import').run()
+        self.run_tasks()
         error = 'Area "superlongtestexistenz" already exists in your game.'
         self.assertTrue(error in self.bob.outq)
         
         # Make sure the import command actually works
         Import(self.bob, 'area superlongtestbar', 'import').run()
+        self.run_tasks()
         b = self.world.get_area('superlongtestbar')
         self.world.log.debug(self.bob.outq)
         self.assertTrue(b)
@@ -202,6 +216,7 @@ class TestBuildCommands(ShinyTestCase):
         
         self.world.destroy_area('superlongtestbar', 'test')
         Import(self.bob, 'area superlongtestbar from email', 'import').run()
+        self.run_tasks()
         error = 'Cannot find transport: load_email'
         self.world.log.debug(self.bob.outq)
         self.assertTrue(error in self.bob.outq)
@@ -1,7 +1,460 @@
 from shinytest import ShinyTestCase
 
+import socket
+from socket import error as socket_error
+from errno import EAGAIN, EPIPE
+
 class TestDB(ShinyTestCase):
     
     def test_something(self):
         pass
 
+
+class TestTelnetNegotiation(ShinyTestCase):
+    def setUp(self):
+        ShinyTestCase.setUp(self)
+        from shinymud.lib.connection_handlers.shiny_connections import TelnetConnection
+        self.client, server = socket.socketpair()
+        self.client.settimeout(1)
+        self.conn = TelnetConnection((server, 'test'), self.world.log, self.world.reactor)
+    
+    def tearDown(self):
+        self.client.close()
+        self.conn.close()
+        ShinyTestCase.tearDown(self)
+    
+    def test_negotiation_does_not_block(self):
+        from shinymud.lib.connection_handlers.telnet import IAC, DO, WILL, LINEMODE, NAWS, \
+                                                           COMPRESS2, GMCP
+        # We ask, but we don't wait around for an answer
+        self.assertEqual(self.client.recv(100), IAC + DO + LINEMODE + IAC + DO + NAWS +
+                                                IAC + WILL + COMPRESS2 + IAC + WILL + GMCP)
+        self.client.send('look\r\n')
+        self.world.reactor.poll(0.1)
+        self.assertEqual(self.conn.recv(), ['look'])
+    
+    def test_late_replies(self):
+        from shinymud.lib.connection_handlers.telnet import IAC, WILL, WONT, DO, SB, SE, \
+                                                           LINEMODE, NAWS, ECHO
+        self.client.recv(100)
+        self.client.send('say hi\r\n')
+        self.world.reactor.poll(0.1)
+        self.assertEqual(self.conn.recv(), ['say hi'])
+        # The client gets around to answering us after it's already been
+        # sending input
+        self.client.send(IAC + WILL + NAWS + IAC + SB + NAWS + '\x00\x64\x01\x00' + IAC + SE)
+        self.world.reactor.poll(0.1)
+        self.assertEqual(self.conn.win_size, (100, 256))
+        self.assertEqual(self.conn.recv(), False)
+        self.assertTrue(self.conn.options.enabled(NAWS))
+        
+        self.client.send(IAC + WILL + LINEMODE + IAC + DO + ECHO)
+        self.world.reactor.poll(0.1)
+        # Linemode gets switched on, and options we don't support are refused
+        self.assertEqual(self.client.recv(100),
+                         IAC + SB + LINEMODE + '\x01\x01' + IAC + SE + IAC + WONT + ECHO)
+        
+        # A client repeating itself doesn't get us into a negotiation loop
+        self.client.send(IAC + WILL + NAWS)
+        self.world.reactor.poll(0.1)
+        self.assertEqual(len(self.conn.outbuf), 0)
+    
+
+    def test_mccp(self):
+        import zlib
+        from shinymud.lib.connection_handlers.telnet import IAC, DO, DONT, SB, SE, COMPRESS2
+        self.client.recv(100)
+        self.client.send(IAC + DO + COMPRESS2)
+        self.world.reactor.poll(0.1)
+        self.assertEqual(self.client.recv(100), IAC + SB + COMPRESS2 + IAC + SE)
+        
+        text = ['You are standing in a long, dusty hallway.'] * 20
+        decompressor = zlib.decompressobj()
+        for turn in range(2):
+            self.conn.send(list(text))
+            # Each turn's output can be decompressed as soon as it arrives
+            self.assertEqual(decompressor.decompress(self.client.recv(4096)),
+                             '\r\n'.join(text))
+        self.assertTrue(self.conn.compression_ratio() > 4)
+        
+        # The client can turn compression back off
+        self.client.send(IAC + DONT + COMPRESS2)
+        self.world.reactor.poll(0.1)
+        decompressor.decompress(self.client.recv(4096))
+        self.assertTrue(decompressor.unused_data == '' and self.conn.compressor is None)
+        self.conn.send(['plain'])
+        self.assertEqual(self.client.recv(100), 'plain')
+    
+
+    def test_gmcp(self):
+        from shinymud.lib.connection_handlers.telnet import IAC, DO, SB, SE, GMCP
+        self.client.recv(100)
+        self.assertFalse(self.conn.oob_wanted('Char.Vitals'))
+        self.client.send(IAC + DO + GMCP)
+        self.world.reactor.poll(0.1)
+        self.assertTrue(self.conn.oob_wanted('Char.Vitals'))
+        # The client only wants to hear about rooms
+        self.client.send(IAC + SB + GMCP + 'Core.Supports.Set ["Room 1"]' + IAC + SE)
+        self.world.reactor.poll(0.1)
+        self.assertFalse(self.conn.oob_wanted('Char.Vitals'))
+        self.assertTrue(self.conn.oob_wanted('Room.Info'))
+        self.conn.send_oob('Room.Info', {'num': '1'})
+        self.conn.flush()
+        self.assertEqual(self.client.recv(100),
+                         IAC + SB + GMCP + 'Room.Info {"num": "1"}' + IAC + SE)
+    
+
+class TestTelnetDecoder(ShinyTestCase):
+    def setUp(self):
+        ShinyTestCase.setUp(self)
+        from shinymud.lib.connection_handlers.telnet import TelnetDecoder
+        self.commands = []
+        self.subnegotiations = []
+        self.decoder = TelnetDecoder(lambda c, o: self.commands.append((c, o)),
+                                     lambda o, d: self.subnegotiations.append((o, d)))
+    
+    def test_multiple_lines(self):
+        self.assertEqual(self.decoder.feed('n\r\nn\r\ne\r\nsay hi'), ['n', 'n', 'e'])
+        self.assertEqual(self.decoder.feed(' there\r'), ['say hi there'])
+        # The rest of the CR LF, a bare LF, a CR NUL and a blank line
+        self.assertEqual(self.decoder.feed('\nlook\nget all\r\x00\r\nw\r\n'),
+                         ['look', 'get all', 'w'])
+    
+    def test_split_sequences(self):
+        from shinymud.lib.connection_handlers.telnet import IAC, WILL, SB, SE, NAWS
+        data = 'lo' + IAC + WILL + NAWS + 'ok' + IAC + SB + NAWS + '\x00' + IAC + IAC + \
+               '\x00\x18' + IAC + SE + '\r\n'
+        # Every possible split of the data decodes the same way
+        for i in range(len(data)):
+            self.commands = []
+            self.subnegotiations = []
+            lines = self.decoder.feed(data[:i]) + self.decoder.feed(data[i:])
+            self.assertEqual(lines, ['look'])
+            self.assertEqual(self.commands, [(WILL, NAWS)])
+            self.assertEqual(self.subnegotiations, [(NAWS, '\x00\xff\x00\x18')])
+    
+    def test_escaped_iac(self):
+        from shinymud.lib.connection_handlers.telnet import IAC, NOP
+        self.assertEqual(self.decoder.feed('a' + IAC + IAC + 'b' + IAC + NOP + 'c\n'),
+                         ['a\xffbc'])
+    
+    def test_long_line(self):
+        max_line = self.decoder.MAX_LINE
+        # A client that never ends its line can't make us hold on to more
+        # than MAX_LINE bytes of it
+        for i in range(10):
+            self.assertEqual(self.decoder.feed('x' * 1000), [])
+        self.assertEqual(self.decoder.line_size, max_line)
+        self.assertEqual(self.decoder.feed('y\r\nlook\r\n'), ['x' * max_line, 'look'])
+    
+
+class TestWebsocket(ShinyTestCase):
+    request = ('GET / HTTP/1.1\r\n'
+               'Host: localhost:4113\r\n'
+               'Upgrade: websocket\r\n'
+               'Connection: Upgrade\r\n'
+               'Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n'
+               'Sec-WebSocket-Version: 13\r\n'
+               '%s\r\n')
+    
+    def setUp(self):
+        ShinyTestCase.setUp(self)
+        from shinymud.lib.connection_handlers.shiny_connections import WebsocketConnection
+        self.client, server = socket.socketpair()
+        self.client.settimeout(1)
+        self.conn = WebsocketConnection((server, 'test'), self.world.log, 'localhost', 4113,
+                                        self.world.reactor)
+    
+    def tearDown(self):
+        self.client.close()
+        self.conn.close()
+        ShinyTestCase.tearDown(self)
+    
+    def client_frame(self, opcode, payload, fin=True, rsv1=False):
+        from struct import pack
+        from shinymud.lib.connection_handlers.websocket import unmask
+        key = 'abcd'
+        first = opcode | (fin and 0x80 or 0) | (rsv1 and 0x40 or 0)
+        return pack('!BB', first, 0x80 | len(payload)) + key + unmask(payload, key)
+    
+    def poll(self, data):
+        self.client.send(data)
+        self.world.reactor.poll(0.1)
+    
+    def test_handshake(self):
+        from shinymud.lib.connection_handlers.websocket import encode_frame, OP_TEXT
+        # Output for the player waits until the handshake is done
+        self.conn.send(['Welcome!', 'Name: '])
+        request = self.request % ''
+        self.poll(request[:30])
+        self.assertFalse(self.conn.handshake_done)
+        self.poll(request[30:])
+        response = self.client.recv(4096)
+        self.assertTrue(response.startswith('HTTP/1.1 101 Switching Protocols\r\n'))
+        self.assertTrue('Sec-WebSocket-Accept: s3pPLMBiTxaQ9kYGzzhZRbK+xOo=\r\n' in response)
+        self.assertTrue(response.endswith('\r\n\r\n' + encode_frame(OP_TEXT, 'Welcome!\r\nName: ')))
+    
+    def test_bad_handshake(self):
+        self.poll('GET / HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        self.assertTrue(self.client.recv(4096).startswith('HTTP/1.1 400 Bad Request'))
+        self.assertEqual(self.conn.recv(), None)
+    
+    def test_messages(self):
+        from shinymud.lib.connection_handlers.websocket import encode_frame, OP_TEXT, \
+                                                              OP_CONTINUATION, OP_PING, OP_PONG
+        self.poll(self.request % '')
+        self.client.recv(4096)
+        # Several lines in one message, and a message in fragments
+        self.poll(self.client_frame(OP_TEXT, 'n\r\ne\n') + self.client_frame(OP_TEXT, 'lo', False))
+        self.assertEqual(self.conn.recv(), ['n', 'e'])
+        self.poll(self.client_frame(OP_PING, 'hi') + self.client_frame(OP_CONTINUATION, 'ok'))
+        self.assertEqual(self.conn.recv(), ['look'])
+        self.assertEqual(self.client.recv(4096), encode_frame(OP_PONG, 'hi'))
+        
+        # Unmasked frames aren't allowed from clients
+        self.poll(encode_frame(OP_TEXT, 'look'))
+        self.assertEqual(self.client.recv(4096), '\x88\x02\x03\xea')
+        self.assertEqual(self.conn.recv(), None)
+    
+    def test_permessage_deflate(self):
+        import zlib
+        from shinymud.lib.connection_handlers.websocket import OP_TEXT, DEFLATE_TAIL
+        self.poll(self.request % 'Sec-WebSocket-Extensions: permessage-deflate; '
+                                 'client_max_window_bits\r\n')
+        response = self.client.recv(4096)
+        self.assertTrue('Sec-WebSocket-Extensions: permessage-deflate; client_max_window_bits=12; '
+                        'server_max_window_bits=12\r\n' in response)
+        
+        inflater = zlib.decompressobj(-15)
+        text = ['You are standing in a long, dusty hallway.'] * 20
+        for turn in range(2):
+            self.conn.send(list(text))
+            frame = self.client.recv(4096)
+            # One compressed text frame per turn
+            self.assertEqual(ord(frame[0]), 0x80 | 0x40 | OP_TEXT)
+            self.assertEqual(inflater.decompress(frame[2:] + DEFLATE_TAIL), '\r\n'.join(text))
+        
+        deflater = zlib.compressobj(6, zlib.DEFLATED, -12)
+        payload = deflater.compress('say hello') + deflater.flush(zlib.Z_SYNC_FLUSH)
+        self.poll(self.client_frame(OP_TEXT, payload[:-4], rsv1=True))
+        self.assertEqual(self.conn.recv(), ['say hello'])
+    
+
+    def test_oob(self):
+        import json
+        from shinymud.lib.connection_handlers.websocket import OP_BINARY
+        self.poll(self.request % '')
+        self.client.recv(4096)
+        self.assertFalse(self.conn.oob_enabled)
+        self.poll(self.client_frame(OP_BINARY, '{"package": "Core.Hello", "data": {}}'))
+        self.assertTrue(self.conn.oob_enabled)
+        self.assertEqual(self.conn.recv(), False)
+        self.conn.send_oob('Char.Vitals', {'hp': 10})
+        self.conn.flush()
+        frame = self.client.recv(4096)
+        self.assertEqual(ord(frame[0]), 0x80 | OP_BINARY)
+        self.assertEqual(json.loads(frame[2:]), {'package': 'Char.Vitals', 'data': {'hp': 10}})
+    
+
+class TestAdmission(ShinyTestCase):
+    def setUp(self):
+        ShinyTestCase.setUp(self)
+        from shinymud.lib.connection_handlers.con_handlers import TelnetHandler
+        self.handler = TelnetHandler(0, '127.0.0.1', self.world)
+        self.handler.start()
+        self.port = self.handler.listener.getsockname()[1]
+        self.clients = []
+    
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        for player in self.world.player_list.values():
+            player.conn.close()
+        self.handler.listener.close()
+        ShinyTestCase.tearDown(self)
+    
+    def connect(self, count):
+        for i in range(count):
+            client = socket.create_connection(('127.0.0.1', self.port))
+            client.settimeout(1)
+            self.clients.append(client)
+        self.world.reactor.poll(0.1)
+    
+    def test_rate_limit(self):
+        from shinymud.lib.admission import Admission
+        self.world.admission = Admission(0, 2, 50)
+        self.connect(3)
+        self.assertEqual(len(self.world.player_list), 2)
+        self.assertEqual(self.world.net_stats['rejected'], 1)
+        # The rejected connection is closed without hearing a thing from us
+        self.assertEqual(self.clients[2].recv(100), '')
+    
+    def test_prelogin_cap(self):
+        from shinymud.lib.admission import Admission
+        self.world.admission = Admission(10, 10, 2)
+        self.connect(3)
+        self.assertEqual(len(self.world.player_list), 2)
+        self.assertEqual(self.world.net_stats['rejected'], 1)
+        self.assertEqual(self.world.prelogin_count, 2)
+        # Once a player leaves (or makes it into the world), there's room for
+        # another
+        self.world.player_list.values()[0].player_logout()
+        self.assertEqual(self.world.prelogin_count, 1)
+        self.world.cleanup()
+        self.connect(1)
+        self.assertEqual(len(self.world.player_list), 2)
+        self.assertEqual(self.world.net_stats['rejected'], 1)
+    
+    def test_bucket_eviction(self):
+        from shinymud.lib.admission import Admission
+        admission = Admission(0, 1, 50)
+        admission.MAX_BUCKETS = 3
+        for host in ('a', 'b', 'c'):
+            self.assertEqual(admission.admit(host, 0, 0), None)
+        # Hearing from a new host forgets the least recently used one, and
+        # only that one
+        self.assertEqual(admission.admit('a', 0, 0), 'connecting too often')
+        self.assertEqual(admission.admit('d', 0, 0), None)
+        self.assertEqual(admission.buckets.keys(), ['c', 'a', 'd'])
+        self.assertEqual(admission.admit('a', 0, 0), 'connecting too often')
+        self.assertEqual(admission.admit('b', 0, 0), None)
+    
+    def test_login_timeout(self):
+        from shinymud.data.config import LOGIN_TIMEOUT
+        self.connect(1)
+        player = self.world.player_list.values()[0]
+        player.do_tick()
+        player.mode.last_input -= LOGIN_TIMEOUT + 1
+        player.do_tick()
+        self.assertTrue(player.quit_flag)
+    
+
+class FakeSocket(object):
+    """A non-blocking socket that only has room for a few bytes at a time."""
+    def __init__(self, room):
+        self.room = room
+        self.written = ''
+        self.sends = 0
+        self.error = None
+    
+    def fileno(self):
+        return -1
+    
+    def setblocking(self, flag):
+        pass
+    
+    def send(self, data):
+        self.sends += 1
+        if self.error:
+            raise socket_error(self.error, 'fake error')
+        if not self.room:
+            raise socket_error(EAGAIN, 'Resource temporarily unavailable')
+        data = data.tobytes()[:self.room]
+        self.room -= len(data)
+        self.written += data
+        return len(data)
+    
+    def close(self):
+        pass
+    
+
+class TestOutputBuffer(ShinyTestCase):
+    def test_partial_writes(self):
+        from shinymud.lib.connection_handlers.shiny_connections import ShinyConnection
+        sock = FakeSocket(4)
+        conn = ShinyConnection((sock, 'test'), self.world.log)
+        conn.outbuf.append('hello ')
+        conn.outbuf.append('world')
+        self.assertTrue(conn.flush())
+        self.assertEqual(sock.written, 'hell')
+        self.assertEqual(len(conn.outbuf), 7)
+        # A full socket buffer isn't an error, we just try again later
+        self.assertTrue(conn.flush())
+        self.assertEqual(len(conn.outbuf), 7)
+        sock.room = 100
+        self.assertTrue(conn.flush())
+        self.assertEqual(sock.written, 'hello world')
+        self.assertEqual(len(conn.outbuf), 0)
+        self.assertEqual(sock.sends, 3)
+    
+    def test_broken_pipe(self):
+        from shinymud.lib.connection_handlers.shiny_connections import ShinyConnection
+        sock = FakeSocket(4)
+        conn = ShinyConnection((sock, 'test'), self.world.log)
+        conn.outbuf.append('hello')
+        sock.error = EPIPE
+        self.assertFalse(conn.flush())
+        self.assertEqual(conn.recv(), None)
+    
+    
+
+class TestBackpressure(ShinyTestCase):
+    def setUp(self):
+        ShinyTestCase.setUp(self)
+        from shinymud.lib.connection_handlers.shiny_connections import TelnetConnection
+        from shinymud.models.player import Player
+        self.sock = FakeSocket(0)
+        self.conn = TelnetConnection((self.sock, 'test'), self.world.log)
+        self.player = Player(self.conn)
+        self.player.name = 'bob'
+        self.player.mode = None
+    
+    def stall(self):
+        from shinymud.data.config import OUTPUT_HIGH_WATER
+        self.conn.outbuf.append('x' * (OUTPUT_HIGH_WATER + 1))
+        self.player.update_output('one last thing')
+        self.player.send_output()
+        self.assertTrue(self.player.backlog is not None)
+    
+    def test_stalled_output_is_bounded(self):
+        from shinymud.data.config import OUTPUT_HIGH_WATER
+        self.stall()
+        self.assertEqual(self.world.net_stats['stalls'], 1)
+        for i in range(OUTPUT_HIGH_WATER / 10):
+            self.player.update_output('Bob says, "%s"' % i, critical=False)
+        self.player.update_output('You are hungry.')
+        self.player.send_output()
+        self.assertTrue(self.player.backlog.size <= OUTPUT_HIGH_WATER)
+        self.assertTrue(self.world.net_stats['bytes_dropped'] > 0)
+        self.assertEqual(self.player.outq, [])
+        
+        # Once the client catches up, what's left of the backlog goes out
+        self.sock.room = OUTPUT_HIGH_WATER * 4
+        self.conn.flush()
+        self.player.send_output()
+        self.assertEqual(self.player.backlog, None)
+        self.assertTrue(self.sock.written.endswith('You are hungry.\r\n> '))
+        self.assertTrue('Bob says, "0"' not in self.sock.written)
+    
+    def test_critical_output_is_bounded(self):
+        from shinymud.data.config import OUTPUT_BACKLOG_CEILING
+        self.stall()
+        # Nothing here can be dropped to stay under OUTPUT_HIGH_WATER, but
+        # the backlog still can't grow past its ceiling
+        for i in range(OUTPUT_BACKLOG_CEILING / 10):
+            self.player.update_output('You are hit! (%s)' % i)
+        self.player.send_output()
+        self.assertTrue(self.player.backlog.size <= OUTPUT_BACKLOG_CEILING)
+        self.assertTrue(self.player.backlog.overflowed)
+        self.assertTrue(self.world.net_stats['bytes_dropped'] > 0)
+        # It's the oldest lines that go
+        lines = self.player.backlog.lines()
+        self.assertEqual(lines[-1], 'You are hit! (%s)' % (OUTPUT_BACKLOG_CEILING / 10 - 1))
+        self.assertTrue('You are hit! (0)' not in lines)
+    
+    def test_critical_overflow_disconnects(self):
+        import shinymud.models.player
+        self.stall()
+        shinymud.models.player.OUTPUT_POLICY = 'disconnect'
+        self.player.backlog.overflowed = True
+        self.player.send_output()
+        self.assertTrue(self.player.logged_out)
+    
+    def test_collapse(self):
+        from shinymud.lib.connection_handlers.shiny_connections import OutputBacklog
+        backlog = OutputBacklog('collapse', 100)
+        for i in range(3):
+            backlog.add('The goblin misses you.', False)
+        backlog.add('You feel better.')
+        self.assertEqual(backlog.lines(), ['The goblin misses you. (x3)', 'You feel better.'])
+        self.assertEqual(backlog.size, 0)
@@ -0,0 +1,72 @@
+from shinytest import ShinyTestCase
+
+class TestProfiler(ShinyTestCase):
+    def test_phases(self):
+        from shinymud.lib.profiler import TurnProfiler
+        profiler = TurnProfiler(3)
+        for i in range(4):
+            profiler.start_turn(0)
+            profiler.phase('npcs', 0.1)
+            profiler.charge('commands', 'look', 0.01 * i)
+            profiler.phase('input', 0.3 + 0.1 * i)
+            self.assertEqual(profiler.slowest_phase()[0], 'input')
+            profiler.end_turn(1)
+        # Only the last three turns are kept
+        self.assertEqual(len(profiler), 3)
+        self.assertAlmostEqual(profiler.phases['input'].percentile(50), 0.4)
+        self.assertAlmostEqual(profiler.phases['input'].max(), 0.5)
+        self.assertEqual(profiler.phases['battles'].max(), 0)
+        self.assertEqual(profiler.phases['turn'].max(), 1)
+        self.assertEqual(profiler.slowest('commands'), [('look', 0.03)])
+        self.assertEqual(profiler.slowest('commands', 1), [('look', 0.03)])
+        self.assertEqual(profiler.slowest('areas'), [])
+
+    def test_lag_command(self):
+        from shinymud.models.player import Player
+        from shinymud.commands.commands import Lag
+        from shinymud.data.config import GOD
+        bob = Player(('bob', 'bar'))
+        bob.playerize({'name': 'bob'})
+        bob.mode = None
+        Lag(bob, '', 'lag').run()
+        self.assertEqual(bob.outq[-1], "You don't have the authority to do that!\n")
+        bob.permissions = bob.permissions | GOD
+        self.world.profiler.start_turn()
+        Lag(bob, '', 'lag').run()
+        self.world.profiler.end_turn()
+        Lag(bob, '1', 'lag').run()
+        self.assertTrue('Turns on record: 1' in bob.outq[-1])
+        self.assertTrue('Commands: lag (' in bob.outq[-1])
+
+    def test_tick_clock(self):
+        from shinymud.lib.clock import TickClock
+        clock = TickClock(4, 'skip', 4, now=0)
+        self.assertTrue(clock.due(0))
+        self.assertEqual(clock.start_tick(0), (1, 1))
+        self.assertFalse(clock.due(0.2))
+        # A late tick doesn't push back the ones after it
+        self.assertEqual(clock.start_tick(0.3), (1, 1))
+        self.assertAlmostEqual(clock.lag, 0.05)
+        self.assertEqual(clock.next_tick, 0.5)
+        # Missed ticks are skipped...
+        self.assertEqual(clock.start_tick(1.1), (1, 1))
+        self.assertEqual(clock.missed, 2)
+        self.assertEqual(clock.next_tick, 1.25)
+        # ...or caught up on...
+        clock.policy = 'catchup'
+        self.assertEqual(clock.start_tick(1.8), (3, 1))
+        self.assertEqual(clock.next_tick, 2.0)
+        # ...or counted for, but never more than max_catchup of them
+        clock.policy = 'scale'
+        self.assertEqual(clock.start_tick(4.0), (1, 4))
+        self.assertEqual(clock.missed, 2 + 5)
+        self.assertEqual(clock.next_tick, 4.25)
+    
+    def test_scaled_ticks(self):
+        from shinymud.models.char_effect import Drunk
+        drunk = Drunk({'duration': 10})
+        drunk.execute(4)
+        self.assertEqual(drunk.duration, 6)
+        drunk.execute(8)
+        self.assertEqual(drunk.duration, 0)
+
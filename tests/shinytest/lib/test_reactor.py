@@ -0,0 +1,31 @@
+from shinytest import ShinyTestCase
+
+import socket
+
+class TestReactor(ShinyTestCase):
+    def setUp(self):
+        ShinyTestCase.setUp(self)
+        from shinymud.lib.connection_handlers.shiny_connections import TelnetConnection
+        self.client, server = socket.socketpair()
+        self.conn = TelnetConnection((server, 'test'), self.world.log, self.world.reactor)
+
+    def tearDown(self):
+        self.client.close()
+        self.conn.close()
+        ShinyTestCase.tearDown(self)
+
+    def test_only_readable_sockets_are_read(self):
+        self.world.reactor.poll(0)
+        self.assertEqual(self.conn.recv(), False)
+
+        self.client.send('look\r\n')
+        self.world.reactor.poll(0.1)
+        self.assertEqual(self.conn.recv(), ['look'])
+        self.assertEqual(self.conn.recv(), False)
+
+    def test_hangup(self):
+        self.client.close()
+        self.world.reactor.poll(0.1)
+        self.assertEqual(self.conn.recv(), None)
+        self.assertTrue(self.conn.fileno() not in self.world.reactor.handlers)
+
@@ -0,0 +1,74 @@
+from shinytest import ShinyTestCase
+
+class FakePlayer(object):
+    name = 'bob'
+    logged_out = False
+    def __init__(self):
+        self.outq = []
+
+    def update_output(self, message):
+        self.outq.append(message)
+
+
+class TestTasks(ShinyTestCase):
+    def test_run(self):
+        import time
+        from shinymud.lib.tasks import TaskScheduler
+        tasks = TaskScheduler(self.world.log)
+        bob = FakePlayer()
+        def steps(name, count):
+            for i in range(count):
+                yield
+            yield '%s done' % name
+        first = tasks.start('first', steps('first', 3), bob)
+        second = tasks.start('second', steps('second', 1), bob)
+        # Even with no time to spare, we get somewhere
+        self.assertEqual(tasks.run(0), 1)
+        self.assertEqual(first.steps_run, 1)
+        # The tasks take turns, and the owner hears about them as they finish
+        tasks.run(time.time() + 10)
+        self.assertEqual(bob.outq, ['second done', 'first done'])
+        self.assertEqual(len(tasks), 0)
+        self.assertTrue(first.done and second.done)
+
+    def test_failure(self):
+        import time
+        from shinymud.lib.tasks import TaskScheduler
+        tasks = TaskScheduler(self.world.log)
+        bob = FakePlayer()
+        def steps():
+            yield
+            raise ValueError('oops')
+        task = tasks.start('broken', steps(), bob)
+        tasks.run(time.time() + 10)
+        self.assertEqual(task.status, 'Failed.')
+        self.assertTrue('failed' in bob.outq[0])
+        self.assertEqual(len(tasks), 0)
+
+    def test_destroy_area_task(self):
+        import time
+        from shinymud.models.area import Area
+        area = Area.create({'name': 'foo'})
+        for i in range(3):
+            area.new_room()
+        bob = FakePlayer()
+        task = self.world.tasks.start('destroy area foo',
+                                      self.world.destroy_area_steps('foo', 'bob'), bob)
+        self.world.tasks.run(0)
+        self.world.tasks.run(0)
+        # The area is out of the world while it's being taken apart, and
+        # comes back (what's left of it) if we're cancelled
+        self.assertFalse(self.world.area_exists('foo'))
+        task.cancel()
+        self.assertTrue(self.world.area_exists('foo'))
+        self.assertEqual(len(area.rooms), 1)
+        self.assertEqual(bob.outq, ['Task 1 (destroy area foo) has been cancelled.\n'])
+
+        self.world.tasks.start('destroy area foo',
+                               self.world.destroy_area_steps('foo', 'bob'), bob)
+        self.world.tasks.run(time.time() + 10)
+        self.assertFalse(self.world.area_exists('foo'))
+        self.assertEqual(bob.outq[-1],
+                         'Area foo was successfully destroyed. I hope you meant to do that.\n')
+        self.assertEqual(self.world.db.select('* from room'), [])
+
@@ -0,0 +1,84 @@
+from shinytest import ShinyTestCase
+
+class TestTimers(ShinyTestCase):
+    def test_run_due(self):
+        from shinymud.lib.timers import TimerQueue
+        timers = TimerQueue(self.world.log)
+        ran = []
+        timers.call_at(20, ran.append, 'b')
+        timers.call_at(10, ran.append, 'a')
+        cancelled = timers.call_at(15, ran.append, 'x')
+        cancelled.cancel()
+        self.assertEqual(len(timers), 2)
+        self.assertEqual(timers.next_due(), 10)
+        self.assertEqual(timers.run_due(5), 0)
+        self.assertEqual(timers.run_due(20), 2)
+        self.assertEqual(ran, ['a', 'b'])
+        self.assertEqual(len(timers), 0)
+    
+    def test_call_every(self):
+        from shinymud.lib.timers import TimerQueue
+        timers = TimerQueue(self.world.log)
+        ran = []
+        timer = timers.call_every(10, ran.append, 'tick')
+        start = timer.when
+        timers.run_due(start)
+        timers.run_due(start + 10)
+        self.assertEqual(ran, ['tick', 'tick'])
+        timer.cancel()
+        timers.run_due(start + 20)
+        self.assertEqual(len(ran), 2)
+    
+    def test_area_reset_scheduling(self):
+        import time
+        from shinymud.models.area import Area
+        from shinymud.models.player import Player
+        from shinymud.data.config import RESET_INTERVAL
+        area = Area.create({'name': 'foo'})
+        room = area.new_room()
+        # The area is due for a reset as soon as someone shows up
+        area.time_of_last_reset = time.time() - RESET_INTERVAL
+        self.assertEqual(len(self.world.timers), 0)
+        bob = Player(('bob', 'bar'))
+        bob.name = 'bob'
+        room.add_char(bob)
+        room.add_char(bob)
+        # Only the first visit schedules a reset
+        self.assertEqual(len(self.world.timers), 1)
+        # (Give or take RESET_JITTER)
+        self.assertEqual(self.world.timers.run_due(self.world.timers.next_due()), 1)
+        self.assertTrue(time.time() - area.time_of_last_reset < RESET_INTERVAL)
+        # Bob is still there, so another reset has been scheduled
+        self.assertEqual(area.times_visited_since_reset, 1)
+        self.assertEqual(len(self.world.timers), 1)
+        
+        room.remove_char(bob)
+        area.time_of_last_reset -= RESET_INTERVAL
+        self.world.timers.run_due(self.world.timers.next_due())
+        self.assertEqual(area.times_visited_since_reset, 0)
+        self.assertEqual(len(self.world.timers), 0)
+    
+    def test_reset_budget(self):
+        import time
+        from shinymud.models.area import Area
+        from shinymud.data.config import RESET_INTERVAL
+        area = Area.create({'name': 'foo'})
+        rooms = [area.new_room() for i in range(3)]
+        area.time_of_last_reset = time.time() - RESET_INTERVAL
+        area.scheduled_reset()
+        self.assertEqual(len(self.world.reset_queue), 3)
+        self.assertEqual(area.resets_pending, 3)
+        # Queueing the area again while it's still waiting does nothing
+        area.time_of_last_reset -= RESET_INTERVAL
+        area.scheduled_reset()
+        self.assertEqual(len(self.world.reset_queue), 3)
+        # Even with no time to spare, a room gets reset every turn
+        self.world.run_resets(0)
+        self.assertEqual(len(self.world.reset_queue), 2)
+        self.assertEqual(self.world.reset_stats['rooms_reset'], 1)
+        # A room that's destroyed while it waits is skipped
+        area.destroy_room(rooms[2].id)
+        self.world.run_resets(time.time() + 10)
+        self.assertEqual(area.resets_pending, 0)
+        self.assertEqual(self.world.reset_stats['rooms_reset'], 2)
+    
@@ -99,3 +99,106 @@ class TestReset(ShinyTestCase):
         self.assertEqual(len(db_scripts), 0)
         self.assertEqual(len(db_items), 0)
         self.assertEqual(len(db_item_types), 0)
+
+
+class TestInputDispatch(ShinyTestCase):
+    def setUp(self):
+        ShinyTestCase.setUp(self)
+        import shinymud.lib.world
+        self.dispatch = shinymud.lib.world.INPUT_DISPATCH
+        shinymud.lib.world.INPUT_DISPATCH = 'immediate'
+    
+    def tearDown(self):
+        import shinymud.lib.world
+        shinymud.lib.world.INPUT_DISPATCH = self.dispatch
+        ShinyTestCase.tearDown(self)
+    
+    def test_immediate_input_dispatch(self):
+        import socket
+        from shinymud.models.player import Player
+        from shinymud.lib.connection_handlers.shiny_connections import TelnetConnection
+        
+        client, server = socket.socketpair()
+        conn = TelnetConnection((server, 'test'), self.world.log, self.world.reactor)
+        conn.player = Player(conn)
+        conn.player.mode = None
+        self.world.player_add(conn.player)
+        client.recv(1024) # throw away the telnet negotiation
+        
+        client.send('bogus\r\n')
+        self.world.poll_network(0)
+        # The command ran and its output went out without waiting for a turn
+        self.assertTrue('I don\'t understand "bogus"' in client.recv(1024))
+        self.assertEqual(len(self.world.input_latency), 1)
+        conn.close()
+        client.close()
+
+
+class TestSubsystemTicks(ShinyTestCase):
+    def test_subsystem_rates(self):
+        from shinymud.lib.clock import TickClock
+        ticked = []
+        for name in self.world.SUBSYSTEMS:
+            self.world.clocks[name] = TickClock(4, 'skip', 4, now=0)
+        self.world.clocks['input'] = TickClock(20, 'skip', 4, now=0)
+        self.world.clocks['battles'] = TickClock(1, 'skip', 4, now=0)
+        for name in ['input', 'battles']:
+            setattr(self.world, 'tick_' + name,
+                    lambda ticks=1, name=name: ticked.append(name))
+        now = 0
+        while now < 1:
+            self.world.turn(now)
+            now = self.world.next_tick()
+        # Fast subsystems aren't held back by slow ones
+        self.assertEqual(ticked.count('input'), 20)
+        self.assertEqual(ticked.count('battles'), 1)
+        self.assertEqual(self.world.clocks['npcs'].ticks, 4)
+        self.assertEqual(self.world.next_tick(), 1)
+
+
+class TestIdlePlayers(ShinyTestCase):
+    def test_idle_player_costs_nothing(self):
+        import socket
+        from shinymud.models.player import Player
+        from shinymud.lib.connection_handlers.shiny_connections import TelnetConnection
+        
+        client, server = socket.socketpair()
+        conn = TelnetConnection((server, 'test'), self.world.log, self.world.reactor)
+        conn.player = Player(conn)
+        conn.player.mode = None
+        self.world.player_add(conn.player)
+        now = 0
+        def turns(count):
+            for i in range(count):
+                self.world.turn(now + i)
+                self.world.poll_network(0)
+        turns(2)
+        client.recv(1024)
+        
+        # Count the work done on the player's behalf from here on
+        calls = []
+        for name in ['do_tick', 'process_input', 'send_output', 'cycle_effects']:
+            method = getattr(conn.player, name)
+            def counted(*args, **kwargs):
+                calls.append(method.__name__)
+                return method(*args, **kwargs)
+            setattr(conn.player, name, counted)
+        now = 10
+        turns(20)
+        self.assertEqual(calls, [])
+        
+        # Until they have something to say
+        client.send('bogus\r\n')
+        self.world.poll_network(0)
+        turns(1)
+        self.assertTrue('I don\'t understand "bogus"' in client.recv(1024))
+        self.assertEqual(calls.count('do_tick'), 1)
+        del calls[:]
+        turns(20)
+        self.assertEqual(calls, [])
+        
+        # They're woken up when their client hangs up, too
+        client.close()
+        self.world.poll_network(0)
+        turns(1)
+        self.assertTrue(conn.player.logged_out)
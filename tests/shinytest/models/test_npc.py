@@ -196,3 +196,35 @@ class TestNpc(ShinyTestCase):
 
 
 
+    
+    def test_run_queue(self):
+        """Test that npcs are queued once, and take turns running their commands"""
+        from shinymud.data.config import NPC_CMDQ_LIMIT
+        from shinymud.lib.clock import TickClock
+        alice = self.area.new_npc().load()
+        carol = self.area.new_npc().load()
+        alice.location = carol.location = self.room
+        for i in range(NPC_CMDQ_LIMIT + 2):
+            alice.perform('emote waves.')
+        carol.perform('emote nods.')
+        # However much alice has to do, she's only in line once
+        self.assertEqual(self.world.active_npcs.values(), [alice, carol])
+        self.assertEqual(len(alice.cmdq), NPC_CMDQ_LIMIT)
+        self.assertEqual(self.world.profiler.turn_counts['npc_drops'], 2)
+        
+        import shinymud.lib.world
+        budget = shinymud.lib.world.NPC_BUDGET
+        shinymud.lib.world.NPC_BUDGET = 0
+        self.world.profiler.start_turn()
+        try:
+            # With no time to spare, only alice gets a turn; carol goes first
+            # next time, and alice goes to the back of the line
+            self.world.tick_npcs()
+            self.assertEqual(len(alice.cmdq), NPC_CMDQ_LIMIT - 1)
+            self.assertEqual(len(carol.cmdq), 1)
+            self.assertEqual(self.world.active_npcs.values(), [carol, alice])
+            self.world.tick_npcs()
+            self.assertEqual(self.world.active_npcs.values(), [alice])
+        finally:
+            shinymud.lib.world.NPC_BUDGET = budget
+        self.assertEqual(self.world.profiler.turn_counts['npc_queue'], 2)
@@ -1,5 +1,27 @@
 from shinytest import ShinyTestCase
 
+class FakeConnection(object):
+    """A connection that's listening to the out-of-band channel."""
+    def __init__(self):
+        self.oob_enabled = True
+        self.oob = []
+        self.sent = []
+    
+    def oob_wanted(self, package):
+        return True
+    
+    def send_oob(self, package, data):
+        self.oob.append((package, data))
+    
+    def send(self, queue):
+        self.sent.extend(queue)
+        del queue[:]
+        return True
+    
+    def flush(self):
+        return True
+    
+
 class TestPlayer(ShinyTestCase):
     def setUp(self):
         ShinyTestCase.setUp(self)
@@ -9,3 +31,70 @@ class TestPlayer(ShinyTestCase):
     def test_something(self):
         pass
     
+    def test_publish_state(self):
+        from shinymud.models.player import Player
+        conn = FakeConnection()
+        bob = Player(conn)
+        bob.playerize({'name': 'bob'})
+        bob.save()
+        bob.mode = None
+        room = self.area.new_room()
+        bob.location = room
+        bob.send_output()
+        packages = [package for package, data in conn.oob]
+        self.assertEqual(packages, ['Char.Vitals', 'Room.Info', 'Char.Items.List'])
+        self.assertEqual(conn.oob[0][1], {'hp': 20, 'maxhp': 20, 'mp': 5, 'maxmp': 5})
+        
+        # Nothing is published until something changes, and then only what
+        # changed is
+        conn.oob = []
+        bob.send_output()
+        self.assertEqual(conn.oob, [])
+        bob.hp = 15
+        item = self.area.new_item().load()
+        bob.item_add(item)
+        bob.send_output()
+        self.assertEqual(conn.oob, [('Char.Vitals', {'hp': 15}),
+                                    ('Char.Items.Add', {'location': 'inv',
+                                     'item': {'id': str(item.dbid or id(item)), 'name': item.name}})])
+    
+    def test_prompt_toggle(self):
+        from shinymud.models.player import Player
+        from shinymud.commands.commands import Prompt
+        conn = FakeConnection()
+        bob = Player(conn)
+        bob.playerize({'name': 'bob'})
+        bob.mode = None
+        bob.update_output('Hello.')
+        bob.send_output()
+        self.assertEqual(conn.sent[-1], '<HP:20/20 MP:5/5> ')
+        Prompt(bob, 'off', 'prompt').run()
+        bob.send_output()
+        self.assertEqual(conn.sent[-1], 'Your prompt has been turned off.')
+    
+    
+    def test_broken_pipe_logout(self):
+        from shinymud.models.player import Player
+        conn = FakeConnection()
+        conn.send = lambda queue: False
+        conn.recv = lambda: None
+        conn.keepalive = lambda: None
+        conn.close = lambda: None
+        bob = Player(conn)
+        bob.playerize({'name': 'bob'})
+        bob.save()
+        bob.mode = None
+        self.world.player_add(bob)
+        alice = Player(FakeConnection())
+        alice.playerize({'name': 'alice'})
+        alice.mode = None
+        self.world.player_add(alice)
+        bob.update_output('Hello.')
+        bob.send_output()
+        # The dead connection is noticed again on the next tick, but bob is
+        # only logged out once
+        bob.do_tick()
+        bob.send_output()
+        self.assertTrue(bob.logged_out)
+        self.assertEqual(self.world.player_delete, ['bob'])
+        self.assertEqual(len([line for line in alice.outq if 'has left the world' in line]), 1)